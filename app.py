@@ -1,7 +1,8 @@
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for, jsonify, Response, session
+from flask import Flask, render_template, request, send_file, flash, redirect, url_for, jsonify, Response, session, stream_with_context
 import os
 import tempfile
 import shutil
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import traceback
@@ -9,31 +10,111 @@ import time
 import gc
 import json
 import threading
-from io import BytesIO
 from datetime import timedelta
 import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO
 from functools import wraps  
-from main_script import main as generate_ppt, set_progress_callback
+from pptx import Presentation
+from job_queue import JobQueue, ProcessJobRunner, QueueFull, TooManyJobs
+from job_state import JobStateStore
+from output_reaper import OutputReaper
+from result_cache import ResultCache
+from main_script import main as generate_ppt, subscribe_progress, publish_progress, company_cache_stats, ai_cache_stats, generation_options, job_output_degraded, ZipStreamWriter
+
+# Under `python app.py`, spawned job worker processes re-import this file as __mp_main__.
+# They only run main_script jobs, so the folders, threads and hooks below are skipped there.
+IN_JOB_WORKER = __name__ == '__mp_main__'
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'dev-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta (minutes=1)  # Session timeout
 
-# For cloud deployment, create temporary folders
-UPLOAD_FOLDER = tempfile.mkdtemp()
-OUTPUT_FOLDER = tempfile.mkdtemp()
+# Behind a load balancer or reverse proxy, set PROXY_FIX_HOPS to the number of proxies
+# so request.remote_addr and the URL scheme come from their X-Forwarded-* headers
+PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', '0'))
+if PROXY_FIX_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS, x_host=PROXY_FIX_HOPS)
+
+# For cloud deployment, create temporary folders (one pair per worker unless
+# UPLOAD_FOLDER/OUTPUT_FOLDER name directories shared by all of them)
+if IN_JOB_WORKER:
+    UPLOAD_FOLDER = OUTPUT_FOLDER = tempfile.gettempdir()
+else:
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or tempfile.mkdtemp()
+    OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER') or tempfile.mkdtemp()
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+# Default home of the shared state files: next to this module, whatever the working directory
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Progress tracking: shared SQLite store so every gunicorn worker sees every job
+JOB_STATE_PATH = os.environ.get('JOB_STATE_PATH', os.path.join(APP_DIR, 'job_state.sqlite3'))
+JOB_STATE_TTL_SECONDS = int(os.environ.get('JOB_STATE_TTL_SECONDS', str(6 * 3600)))
+
+# Retention: one background reaper expires uploads, outputs and backups and caps their disk use.
+# Decks stay downloadable (again, e.g. after a failed or repeated download) until their TTL.
+# Files of running jobs are held in the job state file, so every worker's reaper skips them.
+output_reaper = OutputReaper(
+    {
+        UPLOAD_FOLDER: int(os.environ.get('UPLOAD_TTL_SECONDS', '3600')),
+        OUTPUT_FOLDER: int(os.environ.get('OUTPUT_TTL_SECONDS', '3600')),
+    },
+    backup_ttl_seconds=int(os.environ.get('BACKUP_TTL_SECONDS', '600')),
+    state_path=JOB_STATE_PATH,
+    hold_ttl_seconds=JOB_STATE_TTL_SECONDS,
+    max_bytes=int(os.environ.get('OUTPUT_MAX_DISK_MB', '2048')) * 1024 * 1024,
+    interval_seconds=int(os.environ.get('REAPER_INTERVAL_SECONDS', '60')),
+)
+if not IN_JOB_WORKER:
+    output_reaper.start()
+
+# Finished decks by hash of (datasheet, template, options); RESULT_CACHE_MAX_MB=0 disables it
+result_cache = ResultCache(
+    os.environ.get('RESULT_CACHE_DIR', os.path.join(APP_DIR, 'result_cache')),
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_MB', '1024')) * 1024 * 1024,
+)
 ALLOWED_EXTENSIONS = {'xlsx', 'pptx'}
 
-# Progress tracking globals (in-memory)
-progress_data = {}
-progress_lock = threading.Lock()
+job_state = JobStateStore(
+    JOB_STATE_PATH,
+    ttl_seconds=JOB_STATE_TTL_SECONDS,
+    max_entries=int(os.environ.get('JOB_STATE_MAX_ENTRIES', '5000')),
+)
+# Signalled on every update in this worker so SSE streams push changes at once
+progress_changed = threading.Condition()
+
+# SSE stream settings: keepalive comment interval, maximum stream lifetime, and how
+# often to look for updates written by other workers. Each open stream holds a
+# gunicorn thread, so streams are short (EventSource reconnects by itself) and
+# capped per worker; clients above the cap get 503 and fall back to polling.
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', '60'))
+SSE_POLL_SECONDS = 1.0
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '8'))
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+DEFAULT_PROGRESS = {'step': 0, 'status': 'waiting', 'message': ''}
 
 # NEW: Authentication credentials
 AUTH_USERNAME = os.environ.get('AUTH_USERNAME', 'imarc')
 AUTH_PASSWORD = os.environ.get('AUTH_PASSWORD', 'imarc2024')
 
 # NEW: Login required decorator
+def client_identity():
+    """
+    Key for per-client job limits: an id stored in the signed session cookie at
+    login. Behind a proxy every request shares one remote address, so that
+    cannot tell clients apart.
+    """
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return session['client_id']
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -42,66 +123,101 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def update_progress(session_id, step, status='active', message='', file_path=None):
+def update_progress(session_id, step, status='active', message='', file_path=None, queue_position=None):
     """Update progress for a specific session"""
-    with progress_lock:
-        if session_id not in progress_data:
-            progress_data[session_id] = {}
-        progress_data[session_id] = {
-            'step': step,
-            'status': status,
-            'message': message,
-            'file_path': file_path,
-            'timestamp': datetime.now().isoformat()
-        }
-        print(f"Progress update: Session {session_id}, Step {step}, Status {status}, Message: {message}")
-        
-        # CRITICAL DEBUG: Show the exact data being stored
-        print(f"DEBUG: Progress data for {session_id}: {progress_data[session_id]}")
+    progress = {
+        'step': step,
+        'status': status,
+        'message': message,
+        'file_path': file_path,
+        'timestamp': datetime.now().isoformat()
+    }
+    if queue_position is not None:
+        progress['queue_position'] = queue_position
+    job_state.put(session_id, progress)
+    with progress_changed:
+        progress_changed.notify_all()
+    print(f"Progress update: Session {session_id}, Step {step}, Status {status}, Message: {message}")
+
+# Progress events from main_script arrive in-process, without an HTTP round trip
+if not IN_JOB_WORKER:
+    subscribe_progress(update_progress)
+
+def report_queue_position(session_id, position):
+    """Tell a waiting job where it stands in the queue"""
+    update_progress(session_id, 0, 'queued', f'Waiting in queue (position {position})', queue_position=position)
+
+# Job scheduler: bounded concurrency and a bounded FIFO queue; extra uploads are refused with Retry-After.
+# The queue lives in each gunicorn worker process, so all three limits apply per worker:
+# with `--workers 2` the server runs up to 2 * JOB_WORKERS jobs and a client can hold
+# up to 2 * JOB_MAX_PER_CLIENT, depending on which worker its requests land on.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '20'))
+JOB_MAX_PER_CLIENT = int(os.environ.get('JOB_MAX_PER_CLIENT', '3'))
+job_queue = JobQueue(JOB_WORKERS, JOB_QUEUE_SIZE, max_per_client=JOB_MAX_PER_CLIENT, on_position=report_queue_position)
+
+# Jobs run in recycled worker processes ('process') or concurrently in the queue's threads ('thread');
+# each job's session and progress live in its own job context, so threads do not mix them up
+JOB_RUNNER = os.environ.get('JOB_RUNNER', 'process')
+if JOB_RUNNER == 'process':
+    job_runner = ProcessJobRunner(
+        JOB_WORKERS,
+        max_jobs_per_worker=int(os.environ.get('JOB_MAX_JOBS_PER_WORKER', '20')),
+        memory_limit_mb=int(os.environ.get('JOB_MEMORY_LIMIT_MB', '2048')),
+        cpu_limit_seconds=int(os.environ.get('JOB_CPU_LIMIT_SECONDS', '600')),
+        on_progress=publish_progress,
+    )
+    run_generation = job_runner.run
+else:
+    job_runner = None
+    run_generation = generate_ppt
+
+# Batch generation: one template, a zip of datasheets; decks in flight per batch and the wait after QueueFull
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '200'))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get('BATCH_MAX_IN_FLIGHT', str(JOB_WORKERS)))
+BATCH_RETRY_SECONDS = 5
+
+def queue_rejection_response(error):
+    """429 when this client has too many jobs, 503 when the whole queue is full"""
+    status = 429 if isinstance(error, TooManyJobs) else 503
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 def get_progress(session_id):
     """Get current progress for a session"""
-    with progress_lock:
-        return progress_data.get(session_id, {'step': 0, 'status': 'waiting', 'message': ''})
+    progress, _ = job_state.get(session_id)
+    return progress or dict(DEFAULT_PROGRESS)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def safe_cleanup(file_paths):
-    """Safely cleanup files with retry logic"""
-    for file_path in file_paths:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                print(f"Successfully removed: {file_path}")
-            except Exception as e:
-                print(f"Could not cleanup {file_path}: {e}")
+def result_cache_key(excel_path, ppt_path):
+    """Cache key for these inputs, or None when the result cache is off"""
+    if not result_cache.enabled:
+        return None
+    try:
+        return result_cache.make_key(excel_path, ppt_path, generation_options())
+    except OSError as e:
+        print(f"Warning: could not hash inputs for the result cache: {e}")
+        return None
+
+def store_result(cache_key, output_path, metrics):
+    """Cache a finished deck unless AI content fell back to non-AI text"""
+    if cache_key and metrics is not None and not job_output_degraded(metrics) and os.path.exists(output_path):
+        result_cache.put(cache_key, output_path)
 
 def generate_ppt_with_progress(excel_path, ppt_path, output_path, session_id):
     """Wrapper function to call main script with progress updates"""
-    
-    # Store session_id in a way that ensures it's captured correctly
-    _session_id = session_id  # Create a local copy
-    
-    def progress_update_callback(step, status, message, file_path=None):
-        """Callback function to update progress"""
-        print(f"🔔 CALLBACK TRIGGERED: step={step}, status={status}, session={_session_id}")  # DEBUG LINE
-        
+
+    def progress_sink(_job_session_id, step, status, message, file_path=None):
+        """Per-job progress sink; other jobs in this process keep their own"""
         # Use output_path for completed status
         final_path = output_path if (status == 'completed' and step == 8) else file_path
-        
-        # Call the Flask update_progress function
-        update_progress(_session_id, step, status, message, final_path)
-        
-        print(f"✅ UPDATE_PROGRESS CALLED for session {_session_id}")  # DEBUG LINE
-    
-    # Set the callback in main_script
-    set_progress_callback(progress_update_callback)
-    
-    print(f"📌 Callback set for session: {_session_id}")  # DEBUG LINE
-    
-    # Call your main function
-    generate_ppt(excel_path, ppt_path, output_path)
+        update_progress(session_id, step, status, message, final_path)
+
+    return generate_ppt(excel_path, ppt_path, output_path, session_id=session_id, progress_sink=progress_sink)
 
 # NEW: Login route
 @app.route('/login', methods=['GET', 'POST'])
@@ -112,6 +228,7 @@ def login():
         
         if username == AUTH_USERNAME and password == AUTH_PASSWORD:
             session['authenticated'] = True
+            session['client_id'] = uuid.uuid4().hex
             session.permanent = False  # Session only lasts for browser session
             return redirect(url_for('index'))
         else:
@@ -131,6 +248,15 @@ def logout():
 def index():
     return render_template('index.html')
 
+def remove_temp_dir(temp_dir):
+    """Remove a job's temporary directory"""
+    if os.path.exists(temp_dir):
+        try:
+            shutil.rmtree(temp_dir)
+            print(f"Cleaned up temporary directory: {temp_dir}")
+        except Exception as e:
+            print(f"Warning: Could not clean up temp directory: {e}")
+
 @app.route('/generate', methods=['POST'])
 @login_required  # NEW: Protected
 def generate():
@@ -170,8 +296,14 @@ def generate():
 
         print(f"Processing: {excel_path} + {ppt_path} -> {output_path}")
 
-        # Call your main processing function
-        generate_ppt(excel_path, ppt_path, output_path)
+        # Identical inputs and options return the earlier deck without running the pipeline
+        cache_key = result_cache_key(excel_path, ppt_path)
+        if cache_key and result_cache.get(cache_key, output_path):
+            print(f"Result cache hit: {cache_key[:12]}")
+        else:
+            # Call your main processing function (through the job queue, waiting for our turn)
+            future, _ = job_queue.submit(str(uuid.uuid4()), run_generation, excel_path, ppt_path, output_path, owner=client_identity())
+            store_result(cache_key, output_path, future.result())
 
         # Verify the output file exists
         if not os.path.exists(output_path):
@@ -179,21 +311,21 @@ def generate():
 
         print(f"Generation completed successfully: {output_path}")
 
-        # Read file into memory for sending
-        with open(output_path, 'rb') as f:
-            file_data = f.read()
-        
-        # Create BytesIO object
-        file_io = BytesIO(file_data)
-        file_io.seek(0)
-
-        # Send the file from memory
-        return send_file(
-            file_io,
+        # Stream the file from disk; the temp directory goes once the response is closed
+        response = send_file(
+            output_path,
             as_attachment=True,
             download_name=output_filename,
             mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation'
         )
+        # Werkzeug skips close callbacks for passthrough responses; the file is still read in small blocks
+        response.direct_passthrough = False
+        response.call_on_close(lambda cleanup_dir=temp_dir: remove_temp_dir(cleanup_dir))
+        temp_dir = None
+        return response
+
+    except QueueFull as e:
+        return queue_rejection_response(e)
 
     except Exception as e:
         error_msg = f"Generation failed: {str(e)}"
@@ -201,13 +333,9 @@ def generate():
         return jsonify({'error': error_msg}), 500
 
     finally:
-        # Clean up temporary directory
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-                print(f"Cleaned up temporary directory: {temp_dir}")
-            except Exception as e:
-                print(f"Warning: Could not clean up temp directory: {e}")
+        # Clean up temporary directory unless the response still streams from it
+        if temp_dir:
+            remove_temp_dir(temp_dir)
 
 @app.route('/generate-with-progress', methods=['POST'])
 @login_required  # NEW: Protected
@@ -234,17 +362,34 @@ def generate_with_progress():
         
         # Save files
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        excel_filename = f"excel_{timestamp}_{secure_filename(excel_file.filename)}"
-        ppt_filename = f"ppt_{timestamp}_{secure_filename(ppt_file.filename)}"
+        # Session id keeps concurrent uploads in the same second from overwriting each other
+        excel_filename = f"excel_{timestamp}_{session_id}_{secure_filename(excel_file.filename)}"
+        ppt_filename = f"ppt_{timestamp}_{session_id}_{secure_filename(ppt_file.filename)}"
         
         excel_path = os.path.join(UPLOAD_FOLDER, excel_filename)
         ppt_path = os.path.join(UPLOAD_FOLDER, ppt_filename)
-        output_filename = f"generated_presentation_{timestamp}.pptx"
+        output_filename = f"generated_presentation_{timestamp}_{session_id[:8]}.pptx"
         output_path = os.path.join(OUTPUT_FOLDER, output_filename)
         
+        output_reaper.hold(excel_path, ppt_path, output_path)
         excel_file.save(excel_path)
         ppt_file.save(ppt_path)
-        
+
+        # Identical inputs and options: hand back the earlier deck through the usual progress/download flow
+        cache_key = result_cache_key(excel_path, ppt_path)
+        if cache_key and result_cache.get(cache_key, output_path):
+            output_reaper.discard(excel_path, ppt_path)
+            output_reaper.release(output_path)
+            update_progress(session_id, 1, 'completed', 'Files saved successfully')
+            update_progress(session_id, 8, 'completed', 'Presentation generated successfully! (identical to an earlier run)', output_path)
+            return jsonify({
+                'status': 'success',
+                'session_id': session_id,
+                'queue_position': 0,
+                'cached': True,
+                'redirect_url': f'/progress-view/{session_id}'
+            })
+
         def generate_with_real_progress():
             """Background generation function with real progress tracking"""
             try:
@@ -252,7 +397,8 @@ def generate_with_progress():
                 update_progress(session_id, 1, 'completed', 'Files saved successfully')
 
                 # Pass session_id directly to main function
-                generate_ppt(excel_path, ppt_path, output_path, session_id=session_id)
+                metrics = run_generation(excel_path, ppt_path, output_path, session_id=session_id)
+                store_result(cache_key, output_path, metrics)
                 
             except Exception as e:
                 current_step = get_progress(session_id).get('step', 1)
@@ -260,36 +406,220 @@ def generate_with_progress():
                 print(f"Error in background generation: {traceback.format_exc()}")
                 
             finally:
-                # Cleanup files (delay for download)
-                def delayed_cleanup():
-                    time.sleep(30)  # Wait longer for download
-                    files_to_cleanup = []
-                    if excel_path and os.path.exists(excel_path):
-                        files_to_cleanup.append(excel_path)
-                    if ppt_path and os.path.exists(ppt_path):
-                        files_to_cleanup.append(ppt_path)
-                    safe_cleanup(files_to_cleanup)
-
-                cleanup_thread = threading.Thread(target=delayed_cleanup)
-                cleanup_thread.daemon = True
-                cleanup_thread.start()
-
-        # Start the generation process in a separate thread
-        threading.Thread(target=generate_with_real_progress, daemon=True).start()
+                # Inputs are done with; the output stays until downloaded or expired
+                output_reaper.discard(excel_path, ppt_path)
+                output_reaper.release(output_path)
+
+        # Queue the generation; it starts as soon as a worker is free (the queue reports its position meanwhile)
+        try:
+            job_queue.submit(session_id, generate_with_real_progress, owner=client_identity())
+        except QueueFull:
+            output_reaper.discard(excel_path, ppt_path)
+            output_reaper.release(output_path)
+            raise
         
         # Return JSON response with redirect URL
         return jsonify({
             'status': 'success',
             'session_id': session_id,
+            'queue_position': position,
             'redirect_url': f'/progress-view/{session_id}'
         })
         
+    except QueueFull as e:
+        job_state.delete(session_id)
+        return queue_rejection_response(e)
+
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+def extract_datasheets(zip_file, dest_dir, max_items=BATCH_MAX_ITEMS):
+    """
+    Save the .xlsx members of an uploaded zip into dest_dir; returns [(name, path)].
+    Raises ValueError before writing anything if there are more than max_items.
+    """
+    datasheets = []
+    used_names = set()
+    with zipfile.ZipFile(zip_file) as archive:
+        members = []
+        for member in archive.infolist():
+            base = os.path.basename(member.filename)
+            if member.is_dir() or base.startswith(('.', '~$')) or not base.lower().endswith('.xlsx'):
+                continue
+            if member.file_size > app.config['MAX_CONTENT_LENGTH']:
+                raise ValueError(f'{base} is too large')
+            members.append((member, base))
+            if len(members) > max_items:
+                raise ValueError(f'a batch can hold at most {max_items} datasheets')
+        for member, base in members:
+            name = os.path.splitext(secure_filename(base) or f'datasheet_{len(datasheets) + 1}.xlsx')[0]
+            while name in used_names:
+                name += '_'
+            used_names.add(name)
+            path = os.path.join(dest_dir, f'{name}.xlsx')
+            with archive.open(member) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            datasheets.append((name, path))
+    return datasheets
+
+def stream_batch_results(batch_id, batch_dir, ppt_path, datasheets, owner, in_flight):
+    """
+    Run one job per datasheet on the job queue, at most BATCH_MAX_IN_FLIGHT at a
+    time, and yield a zip with each deck as soon as it finishes, ending with
+    batch_report.json. Each item reports progress under its own session id.
+    Submitted jobs are kept in `in_flight` (future -> item) for close_batch().
+    """
+    buffer = BytesIO()
+    writer = ZipStreamWriter(buffer)
+    pending = deque(
+        {'name': name, 'excel_path': path, 'session_id': f'{batch_id}-{idx}',
+         'output_path': os.path.join(batch_dir, f'{name}.pptx')}
+        for idx, (name, path) in enumerate(datasheets, start=1)
+    )
+    report = []
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    def finish(item, error=None):
+        if error is None:
+            with open(item['output_path'], 'rb') as f:
+                writer.write(f"{item['name']}.pptx", f.read(), compress_type=zipfile.ZIP_STORED)
+        else:
+            update_progress(item['session_id'], 8, 'error', f'Error: {error}')
+        report.append({'datasheet': item['name'], 'session_id': item['session_id'], 'status': 'error' if error else 'completed', 'error': error})
+        # Decks are in the zip now; keep the batch directory small
+        for path in (item['output_path'], item['output_path'].replace('.pptx', '_backup.pptx'), item['excel_path']):
+            if os.path.exists(path):
+                os.remove(path)
+        update_progress(batch_id, 6, 'active', f'{len(report)} of {len(datasheets)} decks finished')
+
+    update_progress(batch_id, 1, 'completed', f'{len(datasheets)} datasheets received')
+    while pending or in_flight:
+        while pending and len(in_flight) < BATCH_MAX_IN_FLIGHT:
+            item = pending[0]
+            item['cache_key'] = result_cache_key(item['excel_path'], ppt_path)
+            if item['cache_key'] and result_cache.get(item['cache_key'], item['output_path']):
+                pending.popleft()
+                update_progress(item['session_id'], 8, 'completed', 'Presentation generated successfully! (identical to an earlier run)')
+                finish(item)
+                continue
+            try:
+                future, _ = job_queue.submit(
+                    item['session_id'], run_generation, item['excel_path'], ppt_path, item['output_path'],
+                    session_id=item['session_id'], owner=owner,
+                )
+            except QueueFull as e:
+                # Wait for room; with our own jobs running, their completion frees it
+                if not in_flight:
+                    time.sleep(min(e.retry_after, BATCH_RETRY_SECONDS))
+                break
+            pending.popleft()
+            in_flight[future] = item
+
+        if in_flight:
+            done, _ = wait(in_flight, timeout=BATCH_RETRY_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    store_result(item['cache_key'], item['output_path'], future.result())
+                    finish(item)
+                except Exception as e:
+                    print(f"Batch item {item['name']} failed: {e}")
+                    finish(item, str(e))
+        data = drain()
+        if data:
+            yield data
+
+    writer.write('batch_report.json', json.dumps(report, indent=2).encode('utf-8'))
+    writer.close()
+    failed = sum(1 for entry in report if entry['error'])
+    update_progress(batch_id, 8, 'completed', f'Batch finished: {len(report) - failed} decks, {failed} failed')
+    yield drain()
+
+def close_batch(batch_dir, in_flight):
+    """
+    Runs when the batch response closes, finished or not: cancel jobs that have not
+    started and remove the batch directory once the running ones are done with it.
+    """
+    running = [future for future in list(in_flight) if not future.cancel()]
+    if not any(not future.done() for future in running):
+        remove_temp_dir(batch_dir)
+        return
+    print(f"Batch response closed with {len(running)} job(s) running; cleaning up when they finish")
+
+    def remove_when_done():
+        wait(running)
+        remove_temp_dir(batch_dir)
+
+    threading.Thread(target=remove_when_done, name="batch-cleanup", daemon=True).start()
+
+@app.route('/generate-batch', methods=['POST'])
+@login_required  # NEW: Protected
+def generate_batch():
+    """One template plus a zip of datasheets; streams back a zip of the generated decks"""
+    batch_id = str(uuid.uuid4())
+    batch_dir = None
+
+    try:
+        if 'ppt_file' not in request.files or 'datasheets_zip' not in request.files:
+            return jsonify({'error': 'Please select a PowerPoint template and a zip of Excel datasheets'}), 400
+
+        ppt_file = request.files['ppt_file']
+        datasheets_zip = request.files['datasheets_zip']
+        if not allowed_file(ppt_file.filename) or not datasheets_zip.filename.lower().endswith('.zip'):
+            return jsonify({'error': 'Please upload a PowerPoint (.pptx) template and a .zip of datasheets'}), 400
+
+        job_queue.check_admission(owner=client_identity())
+
+        # The template is uploaded and checked once, then shared by every deck in the batch
+        batch_dir = tempfile.mkdtemp()
+        ppt_path = os.path.join(batch_dir, f"template_{batch_id}.pptx")
+        ppt_file.save(ppt_path)
+        try:
+            Presentation(ppt_path)
+        except Exception as e:
+            return jsonify({'error': f'Template could not be opened: {e}'}), 400
+
+        try:
+            datasheets = extract_datasheets(datasheets_zip, batch_dir)
+        except (zipfile.BadZipFile, ValueError) as e:
+            return jsonify({'error': f'Invalid datasheets zip: {e}'}), 400
+        if not datasheets:
+            return jsonify({'error': 'The zip contains no .xlsx datasheets'}), 400
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        in_flight = {}
+        response = Response(
+            stream_with_context(stream_batch_results(batch_id, batch_dir, ppt_path, datasheets, client_identity(), in_flight)),
+            mimetype='application/zip',
+            headers={
+                'Content-Disposition': f'attachment; filename=generated_presentations_{timestamp}.zip',
+                'X-Batch-Id': batch_id,
+                'X-Accel-Buffering': 'no',
+            },
+        )
+        response.call_on_close(lambda cleanup_dir=batch_dir: close_batch(cleanup_dir, in_flight))
+        batch_dir = None
+        return response
+
+    except QueueFull as e:
+        return queue_rejection_response(e)
+
+    except Exception as e:
+        print(f"Error: {traceback.format_exc()}")
+        return jsonify({'error': f'Batch failed: {str(e)}'}), 500
+
+    finally:
+        if batch_dir:
+            remove_temp_dir(batch_dir)
+
 @app.route('/progress-update/<session_id>', methods=['POST'])
 def progress_update_endpoint(session_id):
-    """Receive progress updates from main_script via HTTP"""
+    """Receive progress updates from out-of-process runners (PROGRESS_HTTP_URL)"""
     try:
         data = request.get_json(force=True)
         step = data['step']
@@ -306,9 +636,50 @@ def progress_update_endpoint(session_id):
 @app.route('/progress/<session_id>')
 def get_progress_status(session_id):
     """Get progress status for real-time updates"""
-    progress = get_progress(session_id)
+    progress = dict(get_progress(session_id))
+    position = job_queue.position(session_id)
+    if position:
+        progress['queue_position'] = position
     return jsonify(progress)
 
+@app.route('/progress-stream/<session_id>')
+def progress_stream(session_id):
+    """Server-Sent Events stream of progress updates; ends when the job completes or fails"""
+    if not sse_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many progress streams, poll /progress instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_MAX_STREAM_SECONDS)
+        return response
+
+    def events():
+        seen = -1
+        started = last_sent = time.time()
+        yield f"retry: 3000\n\n"
+        while time.time() - started < SSE_MAX_STREAM_SECONDS:
+            progress, version = job_state.get(session_id)
+            if version == seen:
+                # Woken by an update in this worker, or poll for one written by another worker
+                with progress_changed:
+                    progress_changed.wait(timeout=SSE_POLL_SECONDS)
+                if time.time() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                    last_sent = time.time()
+                    yield ": keepalive\n\n"
+                continue
+            seen = version
+            last_sent = time.time()
+            progress = progress or dict(DEFAULT_PROGRESS)
+            yield f"data: {json.dumps(progress)}\n\n"
+            if progress['status'] == 'error' or (progress['status'] == 'completed' and progress['step'] == 8):
+                return
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(sse_slots.release)
+    return response
+
 @app.route('/progress-view/<session_id>')
 @login_required  # NEW: Protected
 def progress_view(session_id):
@@ -341,7 +712,7 @@ def download_generated_file(session_id):
 
 @app.route('/health')
 def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "company_cache": company_cache_stats(), "ai_cache": ai_cache_stats(), "jobs": job_queue.stats(), "job_state": job_state.stats(), "outputs": output_reaper.stats(), "result_cache": result_cache.stats(), "runner": job_runner.stats() if job_runner else JOB_RUNNER}
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,389 @@
+"""
+Bounded FIFO job scheduler for deck generation.
+
+A fixed number of worker threads take jobs in arrival order. Admission is
+refused once the queue is full (QueueFull) or a client already has too many
+jobs waiting or running (TooManyJobs); both carry a Retry-After estimate.
+
+ProcessJobRunner executes the jobs themselves in dedicated worker processes
+with per-job resource limits, so CPU-bound work from concurrent jobs does not
+share one GIL and leaked memory goes away when a worker is recycled.
+"""
+
+import atexit
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class QueueFull(Exception):
+    """The queue has no room; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TooManyJobs(QueueFull):
+    """The client already has its maximum number of jobs queued or running."""
+
+    def __init__(self, retry_after):
+        Exception.__init__(self, f"Too many jobs for this client, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Runs submitted callables on `workers` threads (started with the first
+    job), holding at most `max_queued` jobs in a FIFO queue.
+    `on_position(job_id, position)` is called when a job has to wait and
+    whenever a waiting job moves up (position 1 is next in line). It runs with
+    the queue locked, so the job cannot start while its position is being
+    reported; it must not call back into the queue.
+    """
+
+    def __init__(self, workers, max_queued, max_per_client=0, on_position=None, expected_job_seconds=60.0):
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self.max_per_client = max_per_client
+        self.on_position = on_position
+        self._pending = deque()
+        self._running = {}
+        self._cond = threading.Condition()
+        self._avg_job_seconds = expected_job_seconds
+        self._completed = 0
+        self._rejected = 0
+        self._started = False
+
+    def _start_locked(self):
+        if not self._started:
+            self._started = True
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def _owner_jobs(self, owner):
+        return sum(1 for job in self._pending if job["owner"] == owner) + \
+            sum(1 for job in self._running.values() if job["owner"] == owner)
+
+    def _retry_after_locked(self):
+        waves = math.ceil((len(self._pending) + 1) / self.workers)
+        return max(5, int(waves * self._avg_job_seconds))
+
+    def _check_admission_locked(self, owner):
+        if owner is not None and self.max_per_client and self._owner_jobs(owner) >= self.max_per_client:
+            self._rejected += 1
+            raise TooManyJobs(self._retry_after_locked())
+        if len(self._pending) >= self.max_queued and len(self._running) >= self.workers:
+            self._rejected += 1
+            raise QueueFull(self._retry_after_locked())
+
+    def check_admission(self, owner=None):
+        """Raise QueueFull/TooManyJobs if a job from `owner` would be refused right now."""
+        with self._cond:
+            self._check_admission_locked(owner)
+
+    def submit(self, job_id, fn, *args, owner=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs). Returns (future, position); position 0 means
+        a worker is free and the job starts immediately.
+        """
+        future = Future()
+        with self._cond:
+            self._check_admission_locked(owner)
+            self._start_locked()
+            self._pending.append({"id": job_id, "owner": owner, "future": future, "fn": fn, "args": args, "kwargs": kwargs})
+            idle = self.workers - len(self._running)
+            position = max(0, len(self._pending) - idle)
+            if position:
+                self._report_position_locked(job_id, position)
+            self._cond.notify()
+        return future, position
+
+    def _report_position_locked(self, job_id, position):
+        if self.on_position:
+            try:
+                self.on_position(job_id, position)
+            except Exception as e:
+                print(f"Warning: queue position update failed: {e}")
+
+    def position(self, job_id):
+        """0 while running, 1.. while queued, None if unknown or finished."""
+        with self._cond:
+            if job_id in self._running:
+                return 0
+            for idx, job in enumerate(self._pending, start=1):
+                if job["id"] == job_id:
+                    return idx
+        return None
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "max_queued": self.max_queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_job_seconds": round(self._avg_job_seconds, 1),
+            }
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                self._running[job["id"]] = job
+                for position, queued in enumerate(self._pending, start=1):
+                    self._report_position_locked(queued["id"], position)
+
+            started = time.time()
+            future = job["future"]
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(job["fn"](*job["args"], **job["kwargs"]))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._cond:
+                self._running.pop(job["id"], None)
+                self._completed += 1
+                # Exponentially weighted average keeps Retry-After estimates current
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * (time.time() - started)
+
+
+# --------------- process job runner ---------------
+
+# Exit code of a worker stopped by its memory watchdog
+MEMORY_LIMIT_EXIT_CODE = 3
+_WATCHDOG_INTERVAL_SECONDS = 0.5
+
+
+def _resident_bytes():
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _watch_worker(memory_limit_mb, parent_pid):
+    """
+    Worker watchdog thread: exit once resident memory passes the limit (the
+    parent reports it from the exit code), or once the web process is gone.
+    """
+    limit = int(memory_limit_mb) * 1024 * 1024 if memory_limit_mb else 0
+    while True:
+        if os.getppid() != parent_pid:
+            os._exit(1)
+        if limit:
+            rss = _resident_bytes()
+            if rss is not None and rss > limit:
+                os._exit(MEMORY_LIMIT_EXIT_CODE)
+        time.sleep(_WATCHDOG_INTERVAL_SECONDS)
+
+
+def _apply_job_limits(memory_limit_mb, cpu_limit_seconds):
+    """
+    Limit the CPU time of the next job. Memory is capped by the watchdog's RSS
+    check; only without /proc does it fall back to RLIMIT_DATA (not RLIMIT_AS,
+    which thread stacks and malloc arena reservations inflate well past real use).
+    """
+    if resource is None:
+        return
+    if memory_limit_mb and _resident_bytes() is None:
+        limit = int(memory_limit_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    if cpu_limit_seconds:
+        # RLIMIT_CPU counts the whole process lifetime, so extend it by one job's allowance
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + cpu_limit_seconds)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, memory_limit_mb, cpu_limit_seconds, chart_workers, parent_pid):
+    """Worker process loop: run generation jobs received on `conn` and relay progress back."""
+    threading.Thread(target=_watch_worker, args=(memory_limit_mb, parent_pid), name="job-watchdog", daemon=True).start()
+    import main_script
+    # Workers are not daemonic, so jobs build charts in their own process pool; share the CPUs out
+    main_script.CHART_BUILD_WORKERS = chart_workers
+
+    def relay(session_id, step, status, message, file_path=None):
+        conn.send(("progress", session_id, step, status, message, file_path))
+
+    main_script.subscribe_progress(relay)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        excel_path, ppt_path, output_path, session_id = job
+        try:
+            _apply_job_limits(memory_limit_mb, cpu_limit_seconds)
+            metrics = main_script.main(excel_path, ppt_path, output_path, session_id=session_id)
+            conn.send(("done", None, metrics))
+        except MemoryError:
+            conn.send(("done", f"Job exceeded the memory limit of {memory_limit_mb} MB", None))
+            return  # start the next job in a fresh process
+        except Exception as e:
+            traceback.print_exc()
+            conn.send(("done", f"{type(e).__name__}: {e}", None))
+
+
+class _WorkerProcess:
+    def __init__(self, ctx, memory_limit_mb, cpu_limit_seconds, chart_workers):
+        self.conn, child_conn = ctx.Pipe()
+        # Not daemonic, so a job can start its chart build pool; the watchdog ends
+        # the worker when the web process goes away, and the runner stops it at exit
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit_mb, cpu_limit_seconds, chart_workers, os.getpid()),
+            daemon=False,
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class ProcessJobRunner:
+    """
+    Runs main_script.main() in a pool of `workers` spawned processes. A worker
+    may hold `memory_limit_mb` resident and each job gets `cpu_limit_seconds`
+    of CPU time; a worker is replaced after `max_jobs_per_worker` jobs or when
+    it dies. Each job builds charts with up to `chart_workers` processes (by
+    default the CPUs divided between the workers). Progress events from a
+    worker are passed to `on_progress` in the web process.
+    """
+
+    def __init__(self, workers, max_jobs_per_worker=20, memory_limit_mb=0, cpu_limit_seconds=0, on_progress=None,
+                 chart_workers=None):
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit_seconds = cpu_limit_seconds
+        self.on_progress = on_progress
+        self.chart_workers = chart_workers or max(1, (os.cpu_count() or 1) // max(1, workers))
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = set()
+        # Worker slots; None means start a process on first use
+        self._idle = queue.Queue()
+        for _ in range(max(1, workers)):
+            self._idle.put(None)
+        self._recycled = 0
+        self._crashed = 0
+        self._lock = threading.Lock()
+        # Runs before multiprocessing's own exit handler, which would wait for the workers
+        atexit.register(self.shutdown)
+
+    def _new_worker(self):
+        worker = _WorkerProcess(self._ctx, self.memory_limit_mb, self.cpu_limit_seconds, self.chart_workers)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _stop_worker(self, worker):
+        worker.stop()
+        with self._lock:
+            self._workers.discard(worker)
+
+    def shutdown(self):
+        """Stop every worker process, including those still running a job."""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process.join(timeout=5)
+
+    def run(self, excel_path, ppt_path, output_path, session_id=None):
+        """Run one generation job in a worker process and return its metrics; raises RuntimeError if it fails."""
+        worker = self._idle.get()
+        try:
+            if worker is None or not worker.process.is_alive():
+                if worker is not None:
+                    self._stop_worker(worker)
+                worker = self._new_worker()
+            worker.conn.send((excel_path, ppt_path, output_path, session_id))
+            error, metrics = self._wait_for_result(worker)
+            worker.jobs_done += 1
+        except BaseException:
+            if worker is not None:
+                self._stop_worker(worker)
+            with self._lock:
+                self._crashed += 1
+            worker = None
+            raise
+        finally:
+            if worker is not None and worker.jobs_done >= self.max_jobs_per_worker:
+                self._stop_worker(worker)
+                with self._lock:
+                    self._recycled += 1
+                worker = None
+            self._idle.put(worker)
+
+        if error:
+            raise RuntimeError(error)
+        return metrics
+
+    def _wait_for_result(self, worker):
+        while True:
+            if not worker.conn.poll(1.0):
+                if not worker.process.is_alive():
+                    raise RuntimeError(self._death_reason(worker.process.exitcode))
+                continue
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(timeout=5)
+                raise RuntimeError(self._death_reason(worker.process.exitcode))
+
+            if message[0] == "done":
+                return message[1], message[2]
+            if message[0] == "progress" and self.on_progress:
+                try:
+                    self.on_progress(*message[1:])
+                except Exception as e:
+                    print(f"Warning: progress relay failed: {e}")
+
+    def _death_reason(self, exitcode):
+        # SIGXCPU (24) is raised by RLIMIT_CPU, SIGKILL (9) usually by the OOM killer
+        if exitcode == MEMORY_LIMIT_EXIT_CODE:
+            return f"Job exceeded the memory limit of {self.memory_limit_mb} MB"
+        if exitcode == -24:
+            return f"Job exceeded the CPU limit of {self.cpu_limit_seconds}s"
+        if exitcode == -9:
+            return "Job worker was killed (out of memory?)"
+        return f"Job worker exited unexpectedly (exit code {exitcode})"
+
+    def stats(self):
+        with self._lock:
+            return {"recycled": self._recycled, "crashed": self._crashed, "max_jobs_per_worker": self.max_jobs_per_worker}
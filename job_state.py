@@ -0,0 +1,107 @@
+"""
+Job progress shared by every gunicorn worker.
+
+Progress records live in a SQLite (WAL) file instead of a per-process dict,
+so /progress, /progress-stream and /download-generated work no matter which
+worker serves them. Records expire after a TTL and the table is capped at a
+maximum number of jobs, oldest first.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from sqlite_util import open_shared_sqlite
+
+
+class JobStateStore:
+    """
+    Progress per session id, each with a version number that increases on
+    every update so readers can tell whether anything changed.
+    """
+
+    # Expired and surplus records are pruned every this many writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_shared_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS job_progress ("
+                "session_id TEXT PRIMARY KEY, progress TEXT NOT NULL, "
+                "version INTEGER NOT NULL, updated_at REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS job_progress_updated ON job_progress (updated_at)",
+            )
+            self._local.conn = conn
+        return conn
+
+    def put(self, session_id, progress):
+        """Store `progress` for the session and return its new version."""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO job_progress (session_id, progress, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET progress = excluded.progress, "
+                "version = version + 1, updated_at = excluded.updated_at",
+                (session_id, json.dumps(progress), time.time()),
+            )
+            version = conn.execute(
+                "SELECT version FROM job_progress WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return version
+
+    def get(self, session_id):
+        """(progress, version) for the session, or (None, 0) if unknown or expired."""
+        try:
+            row = self._connect().execute(
+                "SELECT progress, version FROM job_progress WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Warning: job state read failed: {e}")
+            row = None
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def delete(self, session_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM job_progress WHERE session_id = ?", (session_id,))
+
+    def prune(self):
+        """Drop expired records, then the oldest ones beyond `max_entries`."""
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM job_progress WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+                conn.execute(
+                    "DELETE FROM job_progress WHERE session_id IN ("
+                    "SELECT session_id FROM job_progress ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: job state prune failed: {e}")
+
+    def stats(self):
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM job_progress").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        return {"entries": entries, "max_entries": self.max_entries, "ttl_seconds": self.ttl_seconds}
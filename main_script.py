@@ -13,41 +13,163 @@ from pptx.enum.chart import XL_CHART_TYPE
 from pptx.util import Emu
 import anthropic
 from pptx.enum.dml import MSO_COLOR_TYPE
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.oxml import parse_xml
+from pptx.parts.chart import ChartPart
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import random
+import threading
+import hashlib
+import shutil
+import sqlite3
+import struct
+import sys
+import time
+import zipfile
+import contextvars
+import unicodedata
+import zlib
 import os
 
-# Progress tracking - use HTTP instead of callback
+from sqlite_util import open_shared_sqlite
+
+# Progress tracking - events go to in-process subscribers (the Flask app);
+# HTTP is only used by out-of-process runners that set PROGRESS_HTTP_URL
 import requests
 
-# Get Flask port from environment or default
-FLASK_PORT = os.environ.get('PORT', '10000')
+# Base URL of the Flask app for out-of-process runners, e.g. http://localhost:5000
+PROGRESS_HTTP_URL = os.environ.get('PROGRESS_HTTP_URL', '').rstrip('/')
+
+_progress_subscribers = []
+_progress_subscribers_lock = threading.Lock()
+
+def subscribe_progress(callback):
+    """Register callback(session_id, step, status, message, file_path) for progress events."""
+    with _progress_subscribers_lock:
+        if callback not in _progress_subscribers:
+            _progress_subscribers.append(callback)
+
+def unsubscribe_progress(callback):
+    with _progress_subscribers_lock:
+        if callback in _progress_subscribers:
+            _progress_subscribers.remove(callback)
+
+def publish_progress(session_id, step, status, message, file_path=None):
+    """Deliver a progress event to every subscriber, and over HTTP when configured."""
+    with _progress_subscribers_lock:
+        subscribers = list(_progress_subscribers)
+    for callback in subscribers:
+        try:
+            callback(session_id, step, status, message, file_path)
+        except Exception as e:
+            print(f"Warning: Progress subscriber failed: {e}")
+
+    if PROGRESS_HTTP_URL:
+        try:
+            requests.post(
+                f'{PROGRESS_HTTP_URL}/progress-update/{session_id}',
+                json={'step': step, 'status': status, 'message': message, 'file_path': file_path},
+                timeout=2
+            )
+        except Exception as e:
+            print(f"Warning: Could not send progress update: {e}")
 
 def update_step_progress(step, status, message, file_path=None):
-    """Send progress update via HTTP POST to Flask"""
-    # Get session_id from global variable set by Flask
-    session_id = globals().get('CURRENT_SESSION_ID')
-    if not session_id:
+    """Publish a progress update for the current job"""
+    job = current_job()
+    if job is None or not job.session_id:
         print(f"Warning: No session_id set, skipping progress update for step {step}")
         return
-    
-    try:
-        data = {
-            'step': step,
-            'status': status,
-            'message': message,
-            'file_path': file_path
-        }
-        requests.post(
-            f'http://localhost:{FLASK_PORT}/progress-update/{session_id}',
-            json=data,
-            timeout=2
-        )
-        print(f"✅ Progress update sent: step={step}, status={status}, session={session_id}")
-    except Exception as e:
-        print(f"Warning: Could not send progress update: {e}")
+    job.progress_sink(job.session_id, step, status, message, file_path)
+
+_legacy_progress_callback = None
 
 # This function is still needed for compatibility
 def set_progress_callback(callback_func):
-    pass  # No longer needed, but keep for compatibility
+    """Replace the legacy callback(step, status, message, file_path); None removes it."""
+    global _legacy_progress_callback
+    if _legacy_progress_callback is not None:
+        unsubscribe_progress(_legacy_progress_callback)
+        _legacy_progress_callback = None
+    if callback_func is not None:
+        _legacy_progress_callback = lambda session_id, step, status, message, file_path=None: callback_func(step, status, message, file_path)
+        subscribe_progress(_legacy_progress_callback)
+
+# --------------- Job context ---------------
+
+# How long main() waits for a job's background work before reporting metrics
+JOB_SETTLE_SECONDS = float(os.environ.get('JOB_SETTLE_SECONDS', '5'))
+
+class JobContext:
+    """
+    State of one generation job: session id, progress sink, start time (for
+    stage deadlines) and metrics. It lives in a context variable, so jobs
+    running concurrently in one process never see each other's state.
+    """
+
+    def __init__(self, session_id=None, progress_sink=None, started=None):
+        self.session_id = session_id
+        self.progress_sink = progress_sink or publish_progress
+        self.started = time.time() if started is None else started
+        self.metrics = {}
+        self._metrics_lock = threading.Lock()
+        self._futures = []
+
+    def deadline(self, stage):
+        return job_stage_deadline(self.started, stage)
+
+    def record(self, metric, amount=1):
+        """Add `amount` to a job metric; safe to call from pool threads."""
+        with self._metrics_lock:
+            self.metrics[metric] = self.metrics.get(metric, 0) + amount
+
+    def track(self, future):
+        """Remember background work submitted for this job (see settle())."""
+        with self._metrics_lock:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(future)
+
+    def settle(self, timeout):
+        """
+        Wait up to `timeout` for the job's background work, so failures it records
+        are in the metrics snapshot. Work still running counts as `unsettled_tasks`.
+        """
+        with self._metrics_lock:
+            futures = list(self._futures)
+        _, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            self.record("unsettled_tasks", len(not_done))
+
+    def metrics_snapshot(self):
+        with self._metrics_lock:
+            return dict(self.metrics)
+
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+def current_job():
+    """The JobContext of the running job, or None outside main()."""
+    return _current_job.get()
+
+def record_job_metric(metric, amount=1):
+    job = _current_job.get()
+    if job is not None:
+        job.record(metric, amount)
+
+def submit_in_job(pool, fn, *args, **kwargs):
+    """pool.submit() that carries the caller's job context into the worker thread."""
+    future = pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    job = _current_job.get()
+    if job is not None:
+        job.track(future)
+    return future
 
 # Setup Claude with proper error handling
 api_key = os.environ.get('ANTHROPIC_API_KEY')
@@ -55,13 +177,872 @@ api_key = os.environ.get('ANTHROPIC_API_KEY')
 client = None
 try:
     import anthropic
-    client = anthropic.Anthropic(api_key=api_key)
+    # Retries are handled by ai_complete() (jittered backoff within the job deadline)
+    client = anthropic.Anthropic(api_key=api_key, max_retries=0)
     print("Anthropic client initialized successfully")
 except ImportError:
     print("Warning: anthropic package not installed. AI features will be disabled.")
 except Exception as e:
     print(f"Warning: Could not initialize Anthropic client: {e}")
 
+# --------------- Job latency budget ---------------
+
+# Wall-clock budget for one job; keep it below the gunicorn worker timeout
+JOB_TIME_BUDGET_SECONDS = float(os.environ.get('JOB_TIME_BUDGET_SECONDS', '240'))
+
+# Point in the budget (fraction, measured from job start) by which each AI stage must finish
+AI_STAGE_BUDGET_SHARES = {
+    "ai_content": float(os.environ.get('AI_CONTENT_BUDGET_SHARE', '0.5')),
+    "company_enrichment": float(os.environ.get('COMPANY_ENRICH_BUDGET_SHARE', '0.8')),
+}
+
+# Calls are not started with less time than this left
+AI_MIN_CALL_SECONDS = 1.0
+
+
+class AIDeadlineExceeded(Exception):
+    """Raised when an AI call would start after its stage deadline."""
+
+
+def job_stage_deadline(job_started, stage):
+    """Absolute time (time.time()) by which `stage` must be done."""
+    return job_started + JOB_TIME_BUDGET_SECONDS * AI_STAGE_BUDGET_SHARES[stage]
+
+def time_left(deadline):
+    """Seconds until `deadline`, or None when there is no deadline."""
+    return None if deadline is None else deadline - time.time()
+
+# --------------- AI response cache ---------------
+
+AI_MODEL = os.environ.get('AI_MODEL', "claude-3-5-sonnet-20241022")
+
+# 'readwrite' (default), 'replay' (serve recorded responses only, never call the API) or 'off'
+AI_CACHE_MODE = os.environ.get('AI_CACHE_MODE', 'readwrite').lower()
+AI_CACHE_PATH = os.environ.get(
+    'AI_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ai_cache.sqlite3'),
+)
+AI_CACHE_TTL_DAYS = float(os.environ.get('AI_CACHE_TTL_DAYS', '30'))
+AI_CACHE_MAX_MB = float(os.environ.get('AI_CACHE_MAX_MB', '200'))
+
+
+class AIReplayMiss(Exception):
+    """Raised in replay mode when no recorded response exists for a prompt."""
+
+
+class AIResponseCache:
+    """
+    SQLite (WAL) store of model responses keyed by a hash of model, prompt and
+    parameters. Entries expire after `ttl_days`; least recently used entries
+    are evicted once the stored text exceeds `max_mb`.
+    """
+
+    def __init__(self, path, ttl_days, max_mb):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_shared_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS ai_responses ("
+                "key TEXT PRIMARY KEY, model TEXT, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL)",
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, ignore_ttl=False):
+        row = None
+        try:
+            conn = self._connect()
+            min_created = 0 if ignore_ttl else time.time() - self.ttl_seconds
+            row = conn.execute(
+                "SELECT text FROM ai_responses WHERE key = ? AND created_at >= ?", (key, min_created)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE ai_responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: AI cache read failed: {e}")
+        with self._stats_lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, key, model, text):
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_responses (key, model, text, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, text, len(text.encode("utf-8")), now, now),
+            )
+            conn.commit()
+            self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Warning: AI cache write failed: {e}")
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM ai_responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_responses").fetchone()[0]
+        if total > self.max_bytes:
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM ai_responses ORDER BY last_used ASC"):
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM ai_responses WHERE key = ?", stale)
+        conn.commit()
+
+    def stats(self):
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses, "mode": AI_CACHE_MODE}
+
+
+AI_RESPONSE_CACHE = AIResponseCache(AI_CACHE_PATH, AI_CACHE_TTL_DAYS, AI_CACHE_MAX_MB)
+
+# --------------- AI circuit breaker ---------------
+
+# Shared provider state (breaker, rate limits) for all jobs and gunicorn workers
+AI_STATE_PATH = os.environ.get(
+    'AI_STATE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ai_state.sqlite3'),
+)
+AI_BREAKER_WINDOW_SECONDS = float(os.environ.get('AI_BREAKER_WINDOW_SECONDS', '60'))
+AI_BREAKER_MIN_CALLS = int(os.environ.get('AI_BREAKER_MIN_CALLS', '5'))
+AI_BREAKER_FAILURE_RATE = float(os.environ.get('AI_BREAKER_FAILURE_RATE', '0.5'))
+AI_BREAKER_SLOW_SECONDS = float(os.environ.get('AI_BREAKER_SLOW_SECONDS', '45'))
+AI_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('AI_BREAKER_COOLDOWN_SECONDS', '30'))
+
+
+class AICircuitOpen(Exception):
+    """Raised instead of calling the provider while the circuit breaker is open."""
+
+
+class AICircuitBreaker:
+    """
+    Circuit breaker over recent AI calls, stored in SQLite so every job and
+    worker sees the same state. Provider failures (5xx, 429, connection
+    errors) and calls that take longer than `slow_seconds` count as bad;
+    request errors are not recorded. Once at least `min_calls` calls in the
+    window are bad at `failure_rate` or more, the breaker opens for
+    `cooldown` seconds. After the cool-down a single probe call decides
+    whether it closes again or re-opens.
+    """
+
+    def __init__(self, path, window, min_calls, failure_rate, slow_seconds, cooldown):
+        self.path = path
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_shared_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS ai_breaker_calls (ts REAL NOT NULL, bad INTEGER NOT NULL, latency REAL NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS ai_breaker_state ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), state TEXT NOT NULL, open_until REAL NOT NULL, probe_until REAL NOT NULL)",
+                "INSERT OR IGNORE INTO ai_breaker_state (id, state, open_until, probe_until) VALUES (1, 'closed', 0, 0)",
+            )
+            self._local.conn = conn
+        return conn
+
+    def allow(self):
+        """True if a call may go to the provider now."""
+        now = time.time()
+        try:
+            conn = self._connect()
+            state, open_until = conn.execute("SELECT state, open_until FROM ai_breaker_state WHERE id = 1").fetchone()
+            if state == "closed":
+                return True
+            if now < open_until:
+                return False
+            # Cool-down over: let exactly one caller through as the probe
+            probe_until = now + self.slow_seconds
+            claimed = conn.execute(
+                "UPDATE ai_breaker_state SET probe_until = ? WHERE id = 1 AND state = 'open' AND probe_until < ?",
+                (probe_until, now),
+            ).rowcount
+            conn.commit()
+            if claimed == 1:
+                self._local.probe_until = probe_until
+            return claimed == 1
+        except sqlite3.Error as e:
+            print(f"Warning: AI circuit breaker unavailable: {e}")
+            return True
+
+    def release_probe(self):
+        """
+        Give up the probe claimed by this thread's allow() without recording an
+        outcome (the call was never sent, or failed for its own reasons), so the
+        next caller can probe at once.
+        """
+        probe_until = getattr(self._local, "probe_until", None)
+        if probe_until is None:
+            return
+        self._local.probe_until = None
+        try:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE ai_breaker_state SET probe_until = 0 WHERE id = 1 AND state = 'open' AND probe_until = ?",
+                (probe_until,),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: AI circuit breaker update failed: {e}")
+
+    def record(self, ok, latency):
+        """
+        Record the outcome of one provider call and update the breaker state.
+        While the breaker is open only the current probe's outcome counts;
+        late calls started before it opened are dropped.
+        """
+        probe_until = getattr(self._local, "probe_until", None)
+        self._local.probe_until = None
+        now = time.time()
+        bad = int(not ok or latency > self.slow_seconds)
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            state, current_probe = conn.execute("SELECT state, probe_until FROM ai_breaker_state WHERE id = 1").fetchone()
+            if state == "open":
+                if probe_until is not None and probe_until == current_probe:
+                    if bad:
+                        self._open(conn, now)
+                    else:
+                        conn.execute("UPDATE ai_breaker_state SET state = 'closed', open_until = 0, probe_until = 0 WHERE id = 1")
+                        conn.execute("DELETE FROM ai_breaker_calls")
+                        print("AI circuit breaker closed")
+            else:
+                conn.execute("INSERT INTO ai_breaker_calls (ts, bad, latency) VALUES (?, ?, ?)", (now, bad, latency))
+                conn.execute("DELETE FROM ai_breaker_calls WHERE ts < ?", (now - self.window,))
+                total, bad_calls = conn.execute("SELECT COUNT(*), COALESCE(SUM(bad), 0) FROM ai_breaker_calls").fetchone()
+                if total >= self.min_calls and bad_calls / total >= self.failure_rate:
+                    self._open(conn, now)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: AI circuit breaker update failed: {e}")
+            if getattr(self._local, "conn", None) is not None:
+                self._local.conn.rollback()
+
+    def _open(self, conn, now):
+        conn.execute(
+            "UPDATE ai_breaker_state SET state = 'open', open_until = ?, probe_until = 0 WHERE id = 1",
+            (now + self.cooldown,),
+        )
+        conn.execute("DELETE FROM ai_breaker_calls")
+        print(f"⚠️ AI circuit breaker open for {self.cooldown:.0f}s")
+
+    def stats(self):
+        try:
+            state, open_until = self._connect().execute(
+                "SELECT state, open_until FROM ai_breaker_state WHERE id = 1"
+            ).fetchone()
+            return {"state": state, "open_for": max(0.0, round(open_until - time.time(), 1)) if state == "open" else 0.0}
+        except sqlite3.Error:
+            return {"state": "unknown"}
+
+
+AI_CIRCUIT_BREAKER = AICircuitBreaker(
+    AI_STATE_PATH, AI_BREAKER_WINDOW_SECONDS, AI_BREAKER_MIN_CALLS,
+    AI_BREAKER_FAILURE_RATE, AI_BREAKER_SLOW_SECONDS, AI_BREAKER_COOLDOWN_SECONDS,
+)
+
+# --------------- AI rate limiter ---------------
+
+# Provider limits shared by all jobs and workers; 0 disables the limit
+AI_RATE_RPM = float(os.environ.get('AI_RATE_RPM', '50'))
+AI_RATE_TPM = float(os.environ.get('AI_RATE_TPM', '40000'))
+
+# Queue tickets not refreshed for this long belong to dead callers
+AI_RATE_TICKET_STALE_SECONDS = 30.0
+# Waiters re-check (and refresh their ticket) at least this often
+AI_RATE_MAX_SLEEP_SECONDS = AI_RATE_TICKET_STALE_SECONDS / 3
+
+
+class AIRateLimiter:
+    """
+    Token buckets for requests and tokens per minute, stored in SQLite so all
+    jobs and gunicorn workers draw from the same budget. Callers take a
+    ticket and are served strictly in arrival order; the head of the queue
+    waits for both buckets to refill instead of failing with a 429. Everyone
+    else sleeps until the buckets should have refilled for all tickets ahead
+    of theirs, or until a caller in this process leaves the queue.
+    """
+
+    def __init__(self, path, rpm, tpm):
+        self.path = path
+        self.rpm = rpm
+        self.tpm = tpm
+        self._local = threading.local()
+        self._turn = threading.Condition()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_shared_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS ai_rate_buckets ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), requests REAL NOT NULL, tokens REAL NOT NULL, updated_at REAL NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS ai_rate_tickets ("
+                "ticket INTEGER PRIMARY KEY AUTOINCREMENT, tokens REAL NOT NULL, heartbeat REAL NOT NULL)",
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO ai_rate_buckets (id, requests, tokens, updated_at) VALUES (1, ?, ?, ?)",
+                (self.rpm, self.tpm, time.time()),
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    @property
+    def enabled(self):
+        return self.rpm > 0 or self.tpm > 0
+
+    def estimate_tokens(self, prompt, max_tokens):
+        """Upper bound reserved before the call: rough prompt size plus the output cap."""
+        estimate = len(prompt) // 4 + max_tokens
+        return min(estimate, self.tpm) if self.tpm > 0 else estimate
+
+    def _refill(self, conn, now):
+        requests_left, tokens_left, updated_at = conn.execute(
+            "SELECT requests, tokens, updated_at FROM ai_rate_buckets WHERE id = 1"
+        ).fetchone()
+        elapsed = max(0.0, now - updated_at)
+        if self.rpm > 0:
+            requests_left = min(self.rpm, requests_left + elapsed * self.rpm / 60)
+        if self.tpm > 0:
+            tokens_left = min(self.tpm, tokens_left + elapsed * self.tpm / 60)
+        return requests_left, tokens_left
+
+    def acquire(self, tokens, deadline=None):
+        """
+        Block until one request and `tokens` tokens are available, in FIFO order.
+        Raises AIDeadlineExceeded if the wait would run past `deadline`.
+        """
+        if not self.enabled:
+            return
+        try:
+            conn = self._connect()
+            ticket = conn.execute(
+                "INSERT INTO ai_rate_tickets (tokens, heartbeat) VALUES (?, ?)", (tokens, time.time())
+            ).lastrowid
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: AI rate limiter unavailable: {e}")
+            return
+
+        try:
+            while True:
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("UPDATE ai_rate_tickets SET heartbeat = ? WHERE ticket = ?", (now, ticket))
+                conn.execute("DELETE FROM ai_rate_tickets WHERE heartbeat < ?", (now - AI_RATE_TICKET_STALE_SECONDS,))
+                # Capacity needed before our turn: every ticket ahead of ours, plus ours
+                ahead, ahead_tokens = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM ai_rate_tickets WHERE ticket <= ?", (ticket,)
+                ).fetchone()
+                requests_left, tokens_left = self._refill(conn, now)
+                need_requests = ahead if self.rpm > 0 else 0
+                need_tokens = ahead_tokens if self.tpm > 0 else 0
+                if ahead == 1 and requests_left >= need_requests and tokens_left >= need_tokens:
+                    conn.execute(
+                        "UPDATE ai_rate_buckets SET requests = ?, tokens = ?, updated_at = ? WHERE id = 1",
+                        (requests_left - need_requests, tokens_left - need_tokens, now),
+                    )
+                    conn.execute("DELETE FROM ai_rate_tickets WHERE ticket = ?", (ticket,))
+                    conn.commit()
+                    self._next_turn()
+                    return
+                conn.commit()
+
+                wait_seconds = max(
+                    (need_requests - requests_left) * 60 / self.rpm if self.rpm > 0 else 0,
+                    (need_tokens - tokens_left) * 60 / self.tpm if self.tpm > 0 else 0,
+                )
+                remaining = time_left(deadline)
+                if remaining is not None and remaining - wait_seconds < AI_MIN_CALL_SECONDS:
+                    raise AIDeadlineExceeded("AI rate limit wait would exceed the stage deadline")
+                with self._turn:
+                    self._turn.wait(min(max(wait_seconds, 0.01), AI_RATE_MAX_SLEEP_SECONDS))
+        except BaseException:
+            try:
+                conn.rollback()
+                conn.execute("DELETE FROM ai_rate_tickets WHERE ticket = ?", (ticket,))
+                conn.commit()
+            except sqlite3.Error:
+                pass
+            self._next_turn()
+            raise
+
+    def _next_turn(self):
+        # Waiters in this process re-check at once; other workers wake on their timers
+        with self._turn:
+            self._turn.notify_all()
+
+    def settle(self, reserved_tokens, used_tokens, sent=True):
+        """
+        Return the unused part of a token reservation once actual usage is known.
+        A request that was never `sent` also gets its request slot back.
+        """
+        if not self.enabled:
+            return
+        refund_tokens = max(0, reserved_tokens - used_tokens) if self.tpm > 0 else 0
+        refund_requests = 0 if sent or self.rpm <= 0 else 1
+        if not refund_tokens and not refund_requests:
+            return
+        try:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE ai_rate_buckets SET requests = MIN(?, requests + ?), tokens = MIN(?, tokens + ?) WHERE id = 1",
+                (self.rpm, refund_requests, self.tpm, refund_tokens),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: AI rate limiter update failed: {e}")
+        self._next_turn()
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        try:
+            conn = self._connect()
+            requests_left, tokens_left = self._refill(conn, time.time())
+            queued = conn.execute("SELECT COUNT(*) FROM ai_rate_tickets").fetchone()[0]
+            conn.commit()
+            return {"requests_available": round(requests_left, 1), "tokens_available": int(tokens_left), "queued": queued}
+        except sqlite3.Error:
+            return {"enabled": True}
+
+
+AI_RATE_LIMITER = AIRateLimiter(AI_STATE_PATH, AI_RATE_RPM, AI_RATE_TPM)
+
+def ai_available():
+    """True when AI text can be produced: a live client, or recorded responses in replay mode."""
+    return client is not None or AI_CACHE_MODE == 'replay'
+
+# --------------- AI call wrapper: retries, hedging, latency ---------------
+
+# Retries with full-jitter exponential backoff for transient provider errors
+AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES', '2'))
+AI_RETRY_BASE_DELAY = float(os.environ.get('AI_RETRY_BASE_DELAY', '1.0'))
+AI_RETRY_MAX_DELAY = float(os.environ.get('AI_RETRY_MAX_DELAY', '20'))
+
+# A duplicate request is fired once a call outlives the p95 latency of its kind
+AI_HEDGE_ENABLED = os.environ.get('AI_HEDGE_ENABLED', '1') != '0'
+AI_HEDGE_PERCENTILE = float(os.environ.get('AI_HEDGE_PERCENTILE', '95'))
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get('AI_HEDGE_MIN_SAMPLES', '20'))
+# Hedged requests in flight per process; slow calls past this are not hedged
+AI_HEDGE_MAX_IN_FLIGHT = int(os.environ.get('AI_HEDGE_MAX_IN_FLIGHT', '4'))
+
+# Upper bounds (seconds) of the latency histogram buckets
+AI_LATENCY_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32, 64, float("inf"))
+
+
+class LatencyHistogram:
+    """Bucketed latency counts plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets=AI_LATENCY_BUCKETS, window=200):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.recent.append(seconds)
+            for i, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    self.counts[i] += 1
+                    break
+
+    def percentile(self, pct, min_samples=1):
+        with self._lock:
+            if len(self.recent) < min_samples:
+                return None
+            ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def snapshot(self):
+        with self._lock:
+            counts = {("+Inf" if upper == float("inf") else f"{upper:g}"): n for upper, n in zip(self.buckets, self.counts)}
+            total = sum(self.counts)
+        return {"count": total, "buckets": counts, "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99)}
+
+
+AI_LATENCY = {}
+_ai_latency_lock = threading.Lock()
+
+def ai_latency_histogram(label):
+    with _ai_latency_lock:
+        if label not in AI_LATENCY:
+            AI_LATENCY[label] = LatencyHistogram()
+        return AI_LATENCY[label]
+
+class AICallCancelled(Exception):
+    """
+    Raised in the losing request of a hedged pair once the other one has won.
+    `used_tokens` is what the request consumed before it was cut off, if known.
+    """
+
+    def __init__(self, message, used_tokens=None):
+        super().__init__(message)
+        self.used_tokens = used_tokens
+
+
+class _AICancel:
+    """
+    Cancellation flag for one side of a hedged call. Setting it also closes
+    that side's open response stream, so a request stalled waiting for the
+    provider is aborted at once instead of at its next event.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception as e:
+                print(f"Warning: closing cancelled AI stream failed: {e}")
+
+    def attach(self, stream):
+        """Track `stream` until detach(); False if already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._stream = stream
+            return True
+
+    def detach(self):
+        with self._lock:
+            self._stream = None
+
+
+_ai_hedge_slots = threading.BoundedSemaphore(max(1, AI_HEDGE_MAX_IN_FLIGHT))
+
+
+class _AIHedge:
+    """
+    A primary call and its optional duplicate, each on its own thread. The
+    timer starts when the primary request is sent; if it fires first, the
+    duplicate runs on the timer's thread. The caller waits for whichever
+    succeeds first, and the loser is cancelled.
+    """
+
+    def __init__(self, hedge_after, label, call_args):
+        self.hedge_after = hedge_after
+        self.label = label
+        self.call_args = call_args
+        self.primary_cancel = _AICancel()
+        self.hedge_cancel = _AICancel()
+        self.primary = Future()
+        self.hedge = None
+        self._context = contextvars.copy_context()
+        self._timer = None
+        self._finished = False
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self.primary.add_done_callback(lambda _: self._changed.set())
+
+    def start_primary(self, fn):
+        """Run fn() (the primary call with its retries) on its own thread."""
+        def run():
+            try:
+                result = fn()
+            except BaseException as e:
+                self.primary.set_exception(e)
+            else:
+                self.primary.set_result(result)
+        threading.Thread(target=self._context.copy().run, args=(run,), name="ai-primary", daemon=True).start()
+
+    def primary_sent(self):
+        """Called as the primary's first request goes out; starts the hedge timer."""
+        with self._lock:
+            if self._timer is None and not self._finished:
+                self._timer = threading.Timer(self.hedge_after, self._context.run, (self._run_hedge,))
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run_hedge(self):
+        if not _ai_hedge_slots.acquire(blocking=False):
+            print(f"AI call ({self.label}) is slow but {AI_HEDGE_MAX_IN_FLIGHT} hedges are in flight; not hedging")
+            return
+        try:
+            with self._lock:
+                if self._finished:
+                    return
+                self.hedge = Future()
+                self.hedge.add_done_callback(lambda _: self._changed.set())
+            print(f"AI call ({self.label}) slower than p{AI_HEDGE_PERCENTILE:g} ({self.hedge_after:.1f}s), sending hedged request")
+            try:
+                text = _ai_attempt(*self.call_args, cancel=self.hedge_cancel)
+            except BaseException as e:
+                self.hedge.set_exception(e)
+                return
+            self.hedge.set_result(text)
+            self.primary_cancel.set()
+        finally:
+            _ai_hedge_slots.release()
+
+    def stop_timer(self):
+        """No duplicate is started after this; returns the one already running, if any."""
+        with self._lock:
+            self._finished = True
+            if self._timer is not None:
+                self._timer.cancel()
+            return self.hedge
+
+    def result(self):
+        """
+        The first successful reply. If the primary fails, a duplicate already in
+        flight may still succeed; if both fail, the primary's error is raised.
+        """
+        while True:
+            self._changed.clear()
+            with self._lock:
+                hedge = self.hedge
+            for future in (self.primary, hedge):
+                if future is not None and future.done() and future.exception() is None:
+                    return future.result()
+            if self.primary.done():
+                running = self.stop_timer()
+                if running is None or running.done():
+                    return self.primary.result()
+            self._changed.wait()
+
+    def finish(self):
+        """Stop the timer and cancel whichever request is still running."""
+        self.stop_timer()
+        self.primary_cancel.set()
+        self.hedge_cancel.set()
+
+def _is_retryable_ai_error(error):
+    if isinstance(error, getattr(anthropic, "APIConnectionError", ())):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in (408, 409, 429) or (status is not None and status >= 500)
+
+def _is_provider_failure(error, elapsed):
+    """
+    True if a failed call says something about provider health: 5xx, 429,
+    connection errors, and timeouts of at least AI_BREAKER_SLOW_SECONDS.
+    Shorter timeouts come from the job deadline, and other 4xx from the request.
+    """
+    if isinstance(error, getattr(anthropic, "APITimeoutError", ())):
+        return elapsed >= AI_BREAKER_SLOW_SECONDS
+    if isinstance(error, getattr(anthropic, "APIConnectionError", ())):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+def _send_ai_request(model, max_tokens, messages, request_options, cancel):
+    """
+    Send one request. With a `cancel` flag the reply is streamed, and setting
+    the flag closes the stream, so a hedged request that lost the race stops
+    generating tokens even while it is still waiting for the first one.
+    """
+    if cancel is None:
+        return client.messages.create(model=model, max_tokens=max_tokens, messages=messages, **request_options)
+    with client.messages.stream(model=model, max_tokens=max_tokens, messages=messages, **request_options) as stream:
+        if not cancel.attach(stream):
+            raise AICallCancelled("hedged AI request lost the race")
+        try:
+            for _ in stream:
+                if cancel.is_set():
+                    break
+            if not cancel.is_set():
+                return stream.get_final_message()
+        except Exception:
+            # Closing the stream from the winning side surfaces here as a read error
+            if not cancel.is_set():
+                raise
+        finally:
+            cancel.detach()
+        raise AICallCancelled("hedged AI request lost the race", _streamed_tokens(stream))
+
+def _streamed_tokens(stream):
+    """Tokens a cut-off stream had used so far, or None if it never started."""
+    try:
+        usage = stream.current_message_snapshot.usage
+        return usage.input_tokens + usage.output_tokens
+    except Exception:
+        return None
+
+def _ai_attempt(model, max_tokens, messages, reserved_tokens, deadline, label, cancel=None, on_send=None):
+    """
+    One provider call through the circuit breaker and rate limiter. Setting
+    `cancel` aborts the call; `on_send` is called just before the request goes out.
+    """
+    remaining = time_left(deadline)
+    if remaining is not None and remaining < AI_MIN_CALL_SECONDS:
+        raise AIDeadlineExceeded(f"AI stage deadline reached ({remaining:.1f}s left)")
+    if not AI_CIRCUIT_BREAKER.allow():
+        raise AICircuitOpen("AI provider circuit breaker is open")
+
+    try:
+        # Wait our turn for provider capacity, then use whatever time is left
+        AI_RATE_LIMITER.acquire(reserved_tokens, deadline=deadline)
+        request_options = {}
+        remaining = time_left(deadline)
+        if remaining is not None:
+            if remaining < AI_MIN_CALL_SECONDS:
+                AI_RATE_LIMITER.settle(reserved_tokens, 0, sent=False)
+                raise AIDeadlineExceeded(f"AI stage deadline reached ({remaining:.1f}s left)")
+            request_options["timeout"] = remaining
+        if cancel is not None and cancel.is_set():
+            AI_RATE_LIMITER.settle(reserved_tokens, 0, sent=False)
+            raise AICallCancelled("hedged AI request lost the race")
+
+        if on_send is not None:
+            on_send()
+        started = time.time()
+        try:
+            response = _send_ai_request(model, max_tokens, messages, request_options, cancel)
+        except AICallCancelled as e:
+            # The prompt was sent and is billed; without a usage report, charge its estimate
+            used = e.used_tokens if e.used_tokens is not None else max(0, reserved_tokens - max_tokens)
+            AI_RATE_LIMITER.settle(reserved_tokens, used)
+            raise
+        except Exception as e:
+            # Failed requests are not billed for output; give the reservation back
+            AI_RATE_LIMITER.settle(reserved_tokens, 0)
+            if _is_provider_failure(e, time.time() - started):
+                AI_CIRCUIT_BREAKER.record(False, time.time() - started)
+            record_job_metric("ai_errors")
+            raise
+        elapsed = time.time() - started
+        AI_CIRCUIT_BREAKER.record(True, elapsed)
+    finally:
+        # No-op once record() has run; frees an unused probe for the next caller
+        AI_CIRCUIT_BREAKER.release_probe()
+    record_job_metric("ai_calls")
+    record_job_metric("ai_seconds", elapsed)
+    ai_latency_histogram(label).record(elapsed)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        AI_RATE_LIMITER.settle(reserved_tokens, getattr(usage, "input_tokens", 0) + getattr(usage, "output_tokens", 0))
+    return response.content[0].text.strip()
+
+def _ai_attempt_with_retries(model, max_tokens, messages, reserved_tokens, deadline, label, hedge=None):
+    """Retry transient failures with full-jitter exponential backoff, within the deadline."""
+    cancel = hedge.primary_cancel if hedge else None
+    on_send = hedge.primary_sent if hedge else None
+    for attempt in range(AI_MAX_RETRIES + 1):
+        try:
+            return _ai_attempt(model, max_tokens, messages, reserved_tokens, deadline, label, cancel, on_send)
+        except (AICircuitOpen, AIDeadlineExceeded, AICallCancelled):
+            raise
+        except Exception as e:
+            if attempt >= AI_MAX_RETRIES or not _is_retryable_ai_error(e):
+                raise
+            delay = random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * 2 ** attempt))
+            remaining = time_left(deadline)
+            if remaining is not None and remaining - delay < AI_MIN_CALL_SECONDS:
+                raise
+            print(f"AI call failed ({e}), retry {attempt + 1}/{AI_MAX_RETRIES} in {delay:.1f}s")
+            if cancel is None:
+                time.sleep(delay)
+            elif cancel.wait(delay):
+                raise AICallCancelled("hedged AI request lost the race")
+
+def _ai_hedged_call(model, max_tokens, messages, reserved_tokens, deadline, label):
+    """
+    Make the call; if its request outlives the p95 latency of `label`, fire one
+    duplicate request and return whichever succeeds first. Without enough
+    latency samples to hedge, the call runs on this thread.
+    """
+    hedge_after = None
+    if AI_HEDGE_ENABLED:
+        hedge_after = ai_latency_histogram(label).percentile(AI_HEDGE_PERCENTILE, AI_HEDGE_MIN_SAMPLES)
+    if hedge_after is None:
+        return _ai_attempt_with_retries(model, max_tokens, messages, reserved_tokens, deadline, label)
+
+    hedge = _AIHedge(hedge_after, label, (model, max_tokens, messages, reserved_tokens, deadline, label))
+    # The primary runs on its own thread so a stalled request cannot hold the caller once the duplicate wins
+    hedge.start_primary(lambda: _ai_attempt_with_retries(model, max_tokens, messages, reserved_tokens, deadline, label, hedge))
+    try:
+        return hedge.result()
+    finally:
+        hedge.finish()
+
+def ai_complete(prompt, max_tokens, model=None, deadline=None, label="default"):
+    """
+    Send a single-turn prompt and return the reply text, going through the
+    response cache. In replay mode only recorded responses are served and a
+    miss raises AIReplayMiss. With a `deadline`, the request timeout is the
+    time remaining and AIDeadlineExceeded is raised once too little is left.
+    While the circuit breaker is open, AICircuitOpen is raised at once so
+    callers use their fallback content. Latency is recorded per `label`,
+    which also selects the hedging threshold.
+    """
+    model = model or AI_MODEL
+    messages = [{"role": "user", "content": prompt}]
+    key = AIResponseCache.make_key(model, messages, max_tokens=max_tokens)
+
+    if AI_CACHE_MODE != 'off':
+        cached = AI_RESPONSE_CACHE.get(key, ignore_ttl=(AI_CACHE_MODE == 'replay'))
+        if cached is not None:
+            record_job_metric("ai_cache_hits")
+            return cached
+        if AI_CACHE_MODE == 'replay':
+            raise AIReplayMiss(f"No recorded AI response for prompt {key[:12]}")
+
+    if client is None:
+        raise RuntimeError("Anthropic client is not available")
+    reserved_tokens = AI_RATE_LIMITER.estimate_tokens(prompt, max_tokens)
+    try:
+        text = _ai_hedged_call(model, max_tokens, messages, reserved_tokens, deadline, label)
+    except Exception:
+        # Callers substitute non-AI text, so this job's output is degraded
+        record_job_metric("ai_failures")
+        raise
+    if AI_CACHE_MODE != 'off' and text:
+        AI_RESPONSE_CACHE.put(key, model, text)
+    return text
+
+def ai_cache_stats():
+    with _ai_latency_lock:
+        latency = {label: histogram.snapshot() for label, histogram in AI_LATENCY.items()}
+    return {
+        **AI_RESPONSE_CACHE.stats(),
+        "breaker": AI_CIRCUIT_BREAKER.stats(),
+        "rate_limit": AI_RATE_LIMITER.stats(),
+        "latency": latency,
+    }
+
 # --------------- AI Content Control Function ---------------
 
 def should_use_ai_content(excel_path):
@@ -72,7 +1053,12 @@ def should_use_ai_content(excel_path):
     try:
         kv = read_summary_keys(excel_path, sheet_name="Summary")
         ai_setting = kv.get("Do you want AI Content?", "").strip().lower()
-        return ai_setting == "yes" and client is not None
+        if ai_setting != "yes":
+            return False
+        if not ai_available():
+            record_job_metric("ai_unavailable")
+            return False
+        return True
     except Exception as e:
         print(f"Warning: Could not read AI content setting: {e}")
         return False  # Default to False if there's an error
@@ -138,9 +1124,9 @@ def find_year_col(header, year):
             return idx
     raise ValueError(f"Year {year} not found in headers: {header}")
 
-def generate_overview_ai_content(excel_path, existing_kv=None, use_ai=True):
+def generate_overview_ai_content(excel_path, existing_kv=None, use_ai=True, deadline=None):
     """Generate detailed overview content using AI"""
-    if not use_ai or not client:
+    if not use_ai or not ai_available():
         return ""
     
     try:
@@ -176,12 +1162,7 @@ def generate_overview_ai_content(excel_path, existing_kv=None, use_ai=True):
         Write a comprehensive, technical, and market-focused overview.
         """
         
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        content = response.content[0].text.strip()
+        content = ai_complete(prompt, max_tokens=1000, deadline=deadline, label="overview")
         
         # Clean up formatting
         content = re.sub(r'\*\*([^*]+)\*\*', r'\1', content)
@@ -195,9 +1176,9 @@ def generate_overview_ai_content(excel_path, existing_kv=None, use_ai=True):
         print(f"AI overview content generation failed: {e}")
         return ""
 
-def generate_market_overview_content(excel_path, existing_kv=None, use_ai=True):
+def generate_market_overview_content(excel_path, existing_kv=None, use_ai=True, deadline=None):
     """Generate market overview content using AI"""
-    if not use_ai or not client:
+    if not use_ai or not ai_available():
         return ""
     
     try:
@@ -283,12 +1264,7 @@ def generate_market_overview_content(excel_path, existing_kv=None, use_ai=True):
         Focus on comprehensive market intelligence for business decision-making.
         """
         
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        content = response.content[0].text.strip()
+        content = ai_complete(prompt, max_tokens=1500, deadline=deadline, label="market_overview")
         
         # Clean up formatting
         content = re.sub(r'\*\*([^*]+)\*\*', r'\1', content)
@@ -681,6 +1657,63 @@ def extract_dynamic_placeholders(excel_path, include_market_overview=True, inclu
     wb.close()  # Close the workbook
     return kv, volumes, use_ai
 
+# --------------- Background AI content ---------------
+
+# Threads running AI narrative generation alongside deck processing
+AI_CONTENT_WORKERS = int(os.environ.get('AI_CONTENT_WORKERS', '4'))
+
+_ai_content_pool = None
+_ai_content_pool_lock = threading.Lock()
+
+def _get_ai_content_pool():
+    global _ai_content_pool
+    with _ai_content_pool_lock:
+        if _ai_content_pool is None:
+            _ai_content_pool = ThreadPoolExecutor(max_workers=AI_CONTENT_WORKERS, thread_name_prefix="ai-content")
+        return _ai_content_pool
+
+def start_ai_content_generation(excel_path, kv, use_ai=True, deadline=None):
+    """
+    Launch the AI narrative generators in the background as soon as the
+    summary KV is known. Returns {placeholder_key: Future}.
+    """
+    pool = _get_ai_content_pool()
+    return {
+        "Market_Overview_Content": submit_in_job(pool, generate_market_overview_content, excel_path, dict(kv), use_ai, deadline),
+        "Overview_AI_Content": submit_in_job(pool, generate_overview_ai_content, excel_path, dict(kv), use_ai, deadline),
+    }
+
+def fallback_ai_content(kv):
+    """Non-AI narratives used when AI content is unavailable or out of time."""
+    intro = kv.get("Market_Intro_Line", "")
+    outlook = kv.get("Market_Outlook_Line", "")
+    return {
+        "Market_Overview_Content": f"{intro} {outlook}".strip(),
+        "Overview_AI_Content": intro,
+    }
+
+def resolve_ai_content(ai_futures, deadline=None, fallback=None):
+    """
+    Wait for the background AI content until `deadline`. Content that fails,
+    comes back empty or is not ready in time is taken from `fallback`.
+    """
+    fallback = fallback or {}
+    results = {}
+    for key, future in ai_futures.items():
+        remaining = time_left(deadline)
+        try:
+            results[key] = future.result(timeout=None if remaining is None else max(0, remaining)) or ""
+        except FutureTimeoutError:
+            print(f"AI content for {key} missed its deadline, using fallback text")
+            results[key] = ""
+        except Exception as e:
+            print(f"AI content for {key} failed: {e}")
+            results[key] = ""
+        if not results[key] and fallback:
+            record_job_metric("ai_fallbacks")
+            results[key] = fallback.get(key, "")
+    return results
+
 def build_report_subtitle(excel_path):
     """
     Read subtitle from Summary sheet. If not found, fallback to dynamic generation.
@@ -2480,107 +3513,340 @@ def normalize_products(raw):
     cleaned = [p.strip().strip('"').strip("'") for p in parts if p.strip()]
     return cleaned
 
-# --- helper: quick Wikipedia-based founding year lookup (fallback) ---
-def fetch_founding_from_wikipedia(company_name, timeout=8):
+# --- helper: Wikipedia enrichment backend (fallback) ---
+WIKIPEDIA_API_URL = os.environ.get('WIKIPEDIA_API_URL', "https://en.wikipedia.org/w/api.php")
+WIKIPEDIA_WORKERS = int(os.environ.get('WIKIPEDIA_WORKERS', '4'))
+WIKIPEDIA_BATCH_SIZE = 20  # API limit for intro extracts per request
+
+_wikipedia_session = None
+_wikipedia_session_lock = threading.Lock()
+
+def get_wikipedia_session():
+    """Shared requests.Session with a connection pool sized for the lookup threads."""
+    global _wikipedia_session
+    with _wikipedia_session_lock:
+        if _wikipedia_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=WIKIPEDIA_WORKERS * 2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "imarc-data2deck/1.0"
+            _wikipedia_session = session
+        return _wikipedia_session
+
+def _wikipedia_query(params, timeout):
+    r = get_wikipedia_session().get(
+        WIKIPEDIA_API_URL,
+        params={**params, "action": "query", "format": "json", "formatversion": 2},
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    return r.json().get("query", {})
+
+def _wikipedia_extracts(titles, timeout):
     """
-    Try to find a founding year from the company's Wikipedia page.
-    Returns a string year (e.g. "1897") or "" if not found.
+    Fetch intro extracts for up to WIKIPEDIA_BATCH_SIZE titles in one request.
+    Returns {requested_title: extract}, following normalization and redirects.
     """
-    try:
-        API = "https://en.wikipedia.org/w/api.php"
-        # 1) search for the page
-        params = {"action": "query", "list": "search", "srsearch": company_name, "format": "json", "srlimit": 1}
-        r = requests.get(API, params=params, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        hits = data.get("query", {}).get("search", [])
-        if not hits:
-            return ""
-        title = hits[0]["title"]
-
-        # 2) fetch plaintext extract
-        params2 = {"action": "query", "prop": "extracts", "explaintext": 1, "titles": title, "format": "json", "redirects": 1}
-        r2 = requests.get(API, params=params2, timeout=timeout)
-        r2.raise_for_status()
-        pages = r2.json().get("query", {}).get("pages", {})
-        if not pages:
-            return ""
+    query = _wikipedia_query({
+        "prop": "extracts", "exintro": 1, "explaintext": 1, "exlimit": "max",
+        "redirects": 1, "titles": "|".join(titles),
+    }, timeout)
+    resolved = {m["from"]: m["to"] for m in query.get("normalized", []) + query.get("redirects", [])}
+    pages = {p["title"]: p.get("extract", "") for p in query.get("pages", []) if not p.get("missing")}
+
+    extracts = {}
+    for title in titles:
+        final, hops = title, 0
+        while final not in pages and final in resolved and hops < 3:
+            final, hops = resolved[final], hops + 1
+        if pages.get(final):
+            extracts[title] = pages[final]
+    return extracts
+
+def _wikipedia_search_title(company_name, timeout):
+    query = _wikipedia_query({"list": "search", "srsearch": company_name, "srlimit": 1}, timeout)
+    hits = query.get("search", [])
+    return hits[0]["title"] if hits else ""
+
+def _wikipedia_details_from_extract(extract):
+    details = {"founding_year": "", "headquarters": ""}
+    if not extract:
+        return details
+
+    # look for 'Founded', 'Established', 'founded in' patterns
+    m = re.search(r'(?:Founded|Founded in|founded in|Established|established|Founded:|Founded -)\D{0,30}(\d{4})', extract, re.I)
+    if m:
+        details["founding_year"] = m.group(1)
+    else:
+        # fallback: first plausible 4-digit year in whole extract
+        m2 = re.search(r'(\b(17|18|19|20)\d{2}\b)', extract)
+        if m2 and 1700 <= int(m2.group(1)) <= datetime.datetime.now().year:
+            details["founding_year"] = m2.group(1)
 
-        # get extract text
-        page = next(iter(pages.values()))
-        extract = page.get("extract", "")
+    m3 = re.search(r'headquartered in ([A-Z][^.;()]{2,60}?)(?:[.;(]| and )', extract)
+    if m3:
+        details["headquarters"] = m3.group(1).strip().rstrip(",")
+    return details
 
-        # look for 'Founded', 'Established', 'founded in' patterns
-        m = re.search(r'(?:Founded|Founded in|founded in|Established|established|Founded:|Founded -)\D{0,30}(\d{4})', extract, re.I)
-        if m:
-            year = m.group(1)
-            return year
+def _request_timeout(timeout, deadline):
+    """Per-request timeout: `timeout`, cut to the time left before `deadline`."""
+    remaining = time_left(deadline)
+    if remaining is None:
+        return timeout
+    if remaining < AI_MIN_CALL_SECONDS:
+        raise requests.Timeout(f"enrichment deadline reached ({remaining:.1f}s left)")
+    return min(timeout, remaining)
 
-        # fallback: first plausible 4-digit year in whole extract
-        m2 = re.search(r'(\b(17|18|19|20)\d{2}\b)', extract)
-        if m2:
-            y = int(m2.group(1))
-            if 1700 <= y <= datetime.datetime.now().year:
-                return str(y)
+def fetch_wikipedia_details_batch(company_names, timeout=8, deadline=None):
+    """
+    Look up founding year and headquarters for `company_names` on Wikipedia.
+    Names are queried as titles in batches; names without a page are resolved
+    with a search first. Batches run concurrently over one pooled session.
+    Every request is limited to the time left before `deadline`.
+    Returns {company_name: details}; lookups that fail yield empty fields.
+    """
+    names = list(dict.fromkeys(n for n in company_names if n))
 
-    except Exception:
-        return ""
-    return ""
+    def _search(name):
+        try:
+            return _wikipedia_search_title(name, _request_timeout(timeout, deadline))
+        except Exception as e:
+            print(f"Wikipedia search failed for {name}: {e}")
+            record_job_metric("enrichment_failures")
+            return ""
 
-def fetch_company_details(company_name, use_ai=True, ai_timeout=8):
-    details = {
-        "founding_year": "",
-        "headquarters": "",
-        "website": "",
-        "products_offered": []
-    }
+    def _resolve_batch(batch):
+        try:
+            extracts = _wikipedia_extracts(batch, _request_timeout(timeout, deadline))
+        except Exception as e:
+            print(f"Wikipedia lookup failed: {e}")
+            record_job_metric("enrichment_failures", len(batch))
+            return {n: _wikipedia_details_from_extract("") for n in batch}
+
+        missing = [n for n in batch if n not in extracts]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(WIKIPEDIA_WORKERS, len(missing))) as search_pool:
+                searches = [submit_in_job(search_pool, _search, name) for name in missing]
+                titles = {n: t for n, t in zip(missing, (f.result() for f in searches)) if t}
+            if titles:
+                try:
+                    by_title = _wikipedia_extracts(list(dict.fromkeys(titles.values())), _request_timeout(timeout, deadline))
+                except Exception as e:
+                    print(f"Wikipedia lookup failed: {e}")
+                    record_job_metric("enrichment_failures", len(titles))
+                    by_title = {}
+                for name, title in titles.items():
+                    if title in by_title:
+                        extracts[name] = by_title[title]
+
+        return {n: _wikipedia_details_from_extract(extracts.get(n, "")) for n in batch}
+
+    batches = [names[i:i + WIKIPEDIA_BATCH_SIZE] for i in range(0, len(names), WIKIPEDIA_BATCH_SIZE)]
+    results = {}
+    if len(batches) <= 1:
+        for batch in batches:
+            results.update(_resolve_batch(batch))
+    else:
+        with ThreadPoolExecutor(max_workers=min(WIKIPEDIA_WORKERS, len(batches))) as pool:
+            for future in [submit_in_job(pool, _resolve_batch, batch) for batch in batches]:
+                results.update(future.result())
+    return results
+
+def fetch_founding_from_wikipedia(company_name, timeout=8):
+    """
+    Try to find a founding year from the company's Wikipedia page.
+    Returns a string year (e.g. "1897") or "" if not found.
+    """
+    return fetch_wikipedia_details_batch([company_name], timeout).get(company_name, {}).get("founding_year", "")
+
+# Backends used to fill fields the primary (AI) lookup left empty, or to
+# replace it when AI is off. Each takes a list of names (and a `deadline`
+# keyword) and returns {company_name: partial details}.
+COMPANY_ENRICHMENT_BACKENDS = {
+    "wikipedia": fetch_wikipedia_details_batch,
+    "none": None,
+}
+# Opt-in: COMPANY_FALLBACK_BACKEND=wikipedia makes network calls for every company lookup
+COMPANY_FALLBACK_BACKEND = os.environ.get('COMPANY_FALLBACK_BACKEND', 'none')
+
+# --- helper: persistent company details cache (shared by all workers) ---
+COMPANY_CACHE_PATH = os.environ.get(
+    'COMPANY_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'company_cache.sqlite3'),
+)
+COMPANY_CACHE_TTL_DAYS = float(os.environ.get('COMPANY_CACHE_TTL_DAYS', '30'))
+
+# Trailing tokens dropped when building cache keys ("BASF SE" == "basf")
+LEGAL_SUFFIXES = {
+    "ab", "ag", "as", "asa", "bhd", "bv", "co", "company", "corp", "corporation",
+    "gmbh", "group", "holding", "holdings", "inc", "incorporated", "kg", "kgaa", "kk",
+    "limited", "llc", "llp", "lp", "ltd", "nv", "oy", "oyj", "plc", "pte", "pvt",
+    "sa", "sab", "sas", "se", "spa", "srl",
+}
+
+def normalize_company_key(company_name):
+    """Fold case, accents, punctuation and legal suffixes into a stable cache key."""
+    s = unicodedata.normalize("NFKD", str(company_name)).encode("ascii", "ignore").decode("ascii").lower()
+    s = s.replace("&", " and ").replace(".", "")
+    tokens = re.sub(r"[^a-z0-9]+", " ", s).split()
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)
+
+
+class CompanyDetailsCache:
+    """
+    SQLite (WAL) store of company details keyed by normalized name, so every
+    gunicorn worker and job shares lookups. Entries expire after `ttl_days`.
+    """
+
+    def __init__(self, path, ttl_days):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_shared_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS company_details ("
+                "key TEXT PRIMARY KEY, name TEXT, details TEXT NOT NULL, updated_at REAL NOT NULL)",
+            )
+            self._local.conn = conn
+        return conn
 
-    if use_ai and client:
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _key(company_name, source):
+        key = normalize_company_key(company_name)
+        return f"{key}|{source}" if key and source else key
+
+    def get(self, company_name, source=""):
+        """Cached details for the company; `source` names a fallback backend's own entries."""
+        key = self._key(company_name, source)
+        row = None
+        if key:
+            try:
+                row = self._connect().execute(
+                    "SELECT details FROM company_details WHERE key = ? AND updated_at >= ?",
+                    (key, time.time() - self.ttl_seconds),
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Warning: company cache read failed: {e}")
+        self._count(row is not None)
+        return json.loads(row[0]) if row else None
+
+    def put(self, company_name, details, source=""):
+        key = self._key(company_name, source)
+        if not key:
+            return
         try:
-            prompt = f"""
-            Provide very short structured details about the company "{company_name}".
-            Return JSON with keys: founding_year, headquarters, website, products_offered.
-            Example:
-            {{
-              "founding_year": "1897",
-              "headquarters": "Tokyo, Japan",
-              "website": "https://www.example.com",
-              "products_offered": ["Chemicals", "Plastics"]
-            }}
-            Keep it concise and factual.
-            """
-            response = client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=500,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO company_details (key, name, details, updated_at) VALUES (?, ?, ?, ?)",
+                (key, str(company_name), json.dumps(details), time.time()),
             )
-            text = response.content[0].text.strip()
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: company cache write failed: {e}")
 
-            # Clean output and parse JSON
-            if text.startswith("```"):
-                text = re.sub(r"^```[a-zA-Z]*\n", "", text)
-                text = re.sub(r"\n```$", "", text)
-                text = text.strip()
+    def invalidate(self, company_names):
+        keys = [(normalize_company_key(n), normalize_company_key(n) + "|%") for n in company_names]
+        try:
+            conn = self._connect()
+            conn.executemany("DELETE FROM company_details WHERE key = ? OR key LIKE ?", keys)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: company cache invalidate failed: {e}")
 
-            try:
-                parsed = json.loads(text)
+    def stats(self):
+        try:
+            entries = self._connect().execute(
+                "SELECT COUNT(*) FROM company_details WHERE updated_at >= ?",
+                (time.time() - self.ttl_seconds,),
+            ).fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+COMPANY_DETAILS_CACHE = CompanyDetailsCache(COMPANY_CACHE_PATH, COMPANY_CACHE_TTL_DAYS)
+
+def company_cache_stats():
+    """Hit/miss counters for this process plus the number of live entries."""
+    return COMPANY_DETAILS_CACHE.stats()
+
+def prewarm_company_cache(company_names, refresh=False):
+    """
+    Resolve and store details for `company_names` ahead of time.
+    With `refresh`, existing entries are looked up again.
+    """
+    names = [n.strip() for n in company_names if n and n.strip()]
+    if refresh:
+        COMPANY_DETAILS_CACHE.invalidate(names)
+    details = enrich_companies(names, use_ai=True)
+    print(f"Company cache pre-warmed with {len(details)} companies: {company_cache_stats()}")
+    return details
+
+def fetch_company_details(company_name, use_ai=True, ai_timeout=8, deadline=None):
+    """Return company details, served from the shared cache when possible."""
+    if not (use_ai and ai_available()):
+        return _lookup_company_details(company_name, use_ai=False, ai_timeout=ai_timeout)
+
+    cached = COMPANY_DETAILS_CACHE.get(company_name)
+    if cached is not None:
+        return cached
+
+    details = _lookup_company_details(company_name, use_ai=use_ai, ai_timeout=ai_timeout, deadline=deadline)
+    if any(details.values()):
+        COMPANY_DETAILS_CACHE.put(company_name, details)
+    return details
+
+def _parse_ai_json(text, opener="{", closer="}"):
+    """Parse a JSON value from a model reply, tolerating code fences and chatter."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z]*\n", "", text)
+        text = re.sub(r"\n```$", "", text)
+        text = text.strip()
+
+    try:
+        return json.loads(text)
+    except Exception:
+        m = re.search(re.escape(opener) + r".*" + re.escape(closer), text, flags=re.S)
+        if m:
+            try:
+                return json.loads(m.group(0))
             except Exception:
-                m = re.search(r"\{.*\}", text, flags=re.S)
-                if m:
-                    try:
-                        parsed = json.loads(m.group(0))
-                    except:
-                        parsed = {}
-                else:
-                    parsed = {}
+                pass
+    return None
 
-            if isinstance(parsed, dict):
-                details.update({k: v for k, v in parsed.items() if v})
-                
-        except Exception as e:
-            print("AI lookup failed or timed out:", e)
+def _finalize_company_details(parsed):
+    """
+    Normalize a raw details dict. Returns (details, valid); an entry is invalid
+    when it is not a dict, is empty, or carries an implausible founding year.
+    """
+    details = {
+        "founding_year": "",
+        "headquarters": "",
+        "website": "",
+        "products_offered": []
+    }
+    valid = isinstance(parsed, dict)
+    if valid:
+        details.update({k: v for k, v in parsed.items() if v and k in details})
 
     # Normalize and validate data
     details["products_offered"] = normalize_products(details.get("products_offered", ""))
@@ -2588,21 +3854,219 @@ def fetch_company_details(company_name, use_ai=True, ai_timeout=8):
     # Validate founding year
     fy_raw = details.get("founding_year", "")
     if fy_raw:
+        details["founding_year"] = ""
         m = re.search(r'(\d{4})', str(fy_raw))
         if m:
-            try:
-                fy_candidate = int(m.group(1))
-                now_year = datetime.datetime.now().year
-                if 1700 <= fy_candidate <= now_year:
-                    details["founding_year"] = str(fy_candidate)
-                else:
-                    details["founding_year"] = ""
-            except:
-                details["founding_year"] = ""
+            fy_candidate = int(m.group(1))
+            if 1700 <= fy_candidate <= datetime.datetime.now().year:
+                details["founding_year"] = str(fy_candidate)
+        if not details["founding_year"]:
+            valid = False
 
+    if not any(details.values()):
+        valid = False
+    return details, valid
+
+def _lookup_company_details(company_name, use_ai=True, ai_timeout=8, deadline=None):
+    parsed = None
+
+    if use_ai and ai_available():
+        try:
+            prompt = f"""
+            Provide very short structured details about the company "{company_name}".
+            Return JSON with keys: founding_year, headquarters, website, products_offered.
+            Example:
+            {{
+              "founding_year": "1897",
+              "headquarters": "Tokyo, Japan",
+              "website": "https://www.example.com",
+              "products_offered": ["Chemicals", "Plastics"]
+            }}
+            Keep it concise and factual.
+            """
+            parsed = _parse_ai_json(ai_complete(prompt, max_tokens=500, deadline=deadline, label="company"))
+        except Exception as e:
+            print("AI lookup failed or timed out:", e)
+
+    details, valid = _finalize_company_details(parsed)
+    if use_ai and ai_available() and not valid:
+        record_job_metric("company_fallbacks")
     return details
 
-def distribute_company_names_across_template_slides(prs, placeholder, items, duplicate_if_needed=True, use_ai=True):
+# Companies per batched AI lookup; 1 disables batching
+COMPANY_ENRICH_BATCH_SIZE = int(os.environ.get('COMPANY_ENRICH_BATCH_SIZE', '10'))
+
+def _lookup_company_details_batch(company_names, deadline=None):
+    """
+    Ask for several companies in one request and parse the JSON array reply.
+    Returns {company_name: details} for the companies whose entry passed
+    validation; the caller retries the rest.
+    """
+    results = {}
+    try:
+        prompt = f"""
+        Provide very short structured details about each of these companies:
+        {json.dumps(company_names, ensure_ascii=False)}
+        Return a JSON array with one object per company, in the same order, with keys:
+        company, founding_year, headquarters, website, products_offered.
+        Example:
+        [
+          {{
+            "company": "Example Corp",
+            "founding_year": "1897",
+            "headquarters": "Tokyo, Japan",
+            "website": "https://www.example.com",
+            "products_offered": ["Chemicals", "Plastics"]
+          }}
+        ]
+        Keep it concise and factual.
+        """
+        text = ai_complete(prompt, max_tokens=min(4096, 300 * len(company_names) + 200), deadline=deadline, label="company_batch")
+        parsed = _parse_ai_json(text, "[", "]")
+    except Exception as e:
+        print("Batched AI lookup failed or timed out:", e)
+        parsed = None
+
+    if isinstance(parsed, list):
+        # Match entries by (normalized) name first, then unnamed entries by position
+        by_key = {}
+        for entry in parsed:
+            if isinstance(entry, dict) and entry.get("company"):
+                by_key.setdefault(normalize_company_key(entry["company"]), entry)
+        for idx, company in enumerate(company_names):
+            entry = by_key.get(normalize_company_key(company))
+            if entry is None and len(parsed) == len(company_names):
+                positional = parsed[idx]
+                if not (isinstance(positional, dict) and positional.get("company")):
+                    entry = positional
+            details, valid = _finalize_company_details(entry)
+            if valid:
+                results[company] = details
+    # Diagnostic only: these companies are retried one by one
+    if len(results) < len(company_names):
+        record_job_metric("company_batch_invalid", len(company_names) - len(results))
+    return results
+
+def fetch_company_details_batch(company_names, use_ai=True, deadline=None):
+    """
+    Batched counterpart of fetch_company_details sharing the same cache.
+    With AI, companies the batch could not resolve are left out of the result.
+    """
+    if not (use_ai and ai_available()):
+        return {c: _lookup_company_details(c, use_ai=False) for c in company_names}
+
+    results = {}
+    misses = []
+    for company in company_names:
+        cached = COMPANY_DETAILS_CACHE.get(company)
+        if cached is not None:
+            results[company] = cached
+        else:
+            misses.append(company)
+
+    if misses:
+        fetched = _lookup_company_details_batch(misses, deadline=deadline)
+        for company, details in fetched.items():
+            if any(details.values()):
+                COMPANY_DETAILS_CACHE.put(company, details)
+        results.update(fetched)
+    return results
+
+# Concurrent lookups used when enriching a company list before table filling
+COMPANY_ENRICH_WORKERS = int(os.environ.get('COMPANY_ENRICH_WORKERS', '8'))
+
+def enrich_companies(companies, use_ai=True, max_workers=None, batch_size=None, deadline=None):
+    """
+    Resolve details for every company in `companies` with bounded concurrency,
+    `batch_size` companies per request. Returns {company_name: details}; wall
+    time is close to the slowest single request. Companies not resolved by
+    `deadline` are left with empty fields.
+    """
+    unique = list(dict.fromkeys(c for c in companies if c))
+    if not unique:
+        return {}
+
+    size = max(1, batch_size or COMPANY_ENRICH_BATCH_SIZE)
+    batches = [unique[i:i + size] for i in range(0, len(unique), size)]
+    # Sized for per-company retries too; threads are only started when needed
+    workers = max(1, min(max_workers or COMPANY_ENRICH_WORKERS, len(unique)))
+    print(f"Enriching {len(unique)} companies in {len(batches)} batch(es) with {workers} worker(s)...")
+
+    def _resolve(batch):
+        if len(batch) == 1:
+            return {batch[0]: fetch_company_details(batch[0], use_ai=use_ai, deadline=deadline)}
+        return fetch_company_details_batch(batch, use_ai=use_ai, deadline=deadline)
+
+    details_by_company = {}
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="company-enrich")
+    try:
+        pending = {submit_in_job(pool, _resolve, batch): batch for batch in batches}
+        while pending:
+            remaining = time_left(deadline)
+            done, _ = wait(pending, timeout=None if remaining is None else max(0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                late = [company for batch in pending.values() for company in batch]
+                print(f"⚠️ Enrichment deadline reached for {', '.join(late)}")
+                if use_ai:
+                    record_job_metric("company_fallbacks", len(late))
+                for company in late:
+                    details_by_company[company] = fetch_company_details(company, use_ai=False)
+                break
+
+            for future in done:
+                batch = pending.pop(future)
+                try:
+                    resolved = future.result()
+                except Exception as e:
+                    print(f"⚠️ Enrichment failed for {', '.join(batch)}: {e}")
+                    resolved = {}
+                details_by_company.update(resolved)
+                missing = [c for c in batch if c not in resolved]
+                if missing and len(batch) > 1:
+                    # Retry what the batch could not resolve, concurrently on the same pool
+                    print(f"Retrying {len(missing)} of {len(batch)} companies individually")
+                    for company in missing:
+                        pending[submit_in_job(pool, _resolve, [company])] = [company]
+                else:
+                    if missing and use_ai:
+                        record_job_metric("company_fallbacks", len(missing))
+                    for company in missing:
+                        details_by_company[company] = fetch_company_details(company, use_ai=False)
+    finally:
+        # Lookups still running past the deadline are abandoned, not awaited
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Fill remaining gaps from the fallback backend
+    backend = COMPANY_ENRICHMENT_BACKENDS.get(COMPANY_FALLBACK_BACKEND)
+    gaps = [c for c in unique if not (details_by_company[c].get("founding_year") and details_by_company[c].get("headquarters"))]
+    if backend and gaps and (time_left(deadline) is None or time_left(deadline) > 0):
+        # Backend results are cached under their own source, apart from AI details
+        fallback = {}
+        for company in gaps:
+            cached = COMPANY_DETAILS_CACHE.get(company, source=COMPANY_FALLBACK_BACKEND)
+            if cached is not None:
+                fallback[company] = cached
+        lookup = [c for c in gaps if c not in fallback]
+        if lookup:
+            print(f"Filling gaps for {len(lookup)} companies from {COMPANY_FALLBACK_BACKEND}...")
+            try:
+                fetched = backend(lookup, deadline=deadline)
+            except Exception as e:
+                print(f"⚠️ Fallback enrichment failed: {e}")
+                record_job_metric("enrichment_failures", len(lookup))
+                fetched = {}
+            for company, found in fetched.items():
+                if any(found.values()):
+                    COMPANY_DETAILS_CACHE.put(company, found, source=COMPANY_FALLBACK_BACKEND)
+            fallback.update(fetched)
+        for company in gaps:
+            details = details_by_company[company]
+            for key, value in (fallback.get(company) or {}).items():
+                if value and not details.get(key):
+                    details[key] = value
+    return details_by_company
+
+def distribute_company_names_across_template_slides(prs, placeholder, items, duplicate_if_needed=True, use_ai=True, deadline=None):
     """
     Fill company details dynamically in table (using Gemini for details).
     Columns assumed as:
@@ -2649,6 +4113,10 @@ def distribute_company_names_across_template_slides(prs, placeholder, items, dup
     total_capacity = sum(t["capacity"] for t in templates)
     print(f"Found {len(templates)} template slide(s), capacities: {[t['capacity'] for t in templates]} → total {total_capacity}")
 
+    # Resolve all company details up front so table filling never blocks on lookups
+    fill_items = items if duplicate_if_needed else items[:total_capacity]
+    company_details = enrich_companies(fill_items, use_ai=use_ai, deadline=deadline)
+
     def _fill_table_object(tbl_obj, col_idx, header_offset, chunk_items, formatting):
         """
         Fills a chunk of companies into table tbl_obj starting at header_offset row,
@@ -2659,8 +4127,8 @@ def distribute_company_names_across_template_slides(prs, placeholder, items, dup
             if row_index >= len(tbl_obj.rows):
                 continue
 
-            # Get details (AI + fallback)
-            details = fetch_company_details(company, use_ai=use_ai)  # <-- Changed here to respect the passed use_ai
+            # Details were resolved by the enrichment stage
+            details = company_details.get(company) or fetch_company_details(company, use_ai=False)
 
             # Values for first four columns
             values = [
@@ -2802,150 +4270,396 @@ def determine_doughnut_data_source(chart_title, slide_idx):
     else:
         return "By_Region", "Region"
 
-def format_column_chart_enhanced(chart, values, unit="", chart_type_name=""):
+# --------------- chart style presets ---------------
+
+# Bar colours for column charts, cycled per point
+COLUMN_CHART_PALETTE = [
+    "4472C4",  # Blue
+    "70AD47",  # Green
+    "ED7D31",  # Orange
+    "A5A5A5",  # Gray
+    "FFC000",  # Yellow
+    "5B9BD5",  # Light Blue
+    "92D050",  # Light Green
+    "FF6600",  # Bright Orange
+    "C0C0C0",  # Silver
+    "FFFF00",  # Bright Yellow
+]
+
+# Segment colours for doughnut charts, one scheme per data sheet
+DOUGHNUT_CHART_PALETTES = {
+    "By_Type": ["4472C4", "70AD47", "FFC000"],
+    "By_Application": ["ED7D31", "A5A5A5", "4472C4", "70AD47", "FFC000"],
+    "By_EndUser": ["70AD47", "FFC000", "ED7D31", "A5A5A5", "4472C4"],
+    "By_Region": ["FFC000", "ED7D31", "4472C4"],
+}
+
+_CHART_FONT_TXPR_XML = (
+    '<c:txPr %s><a:bodyPr/><a:lstStyle/><a:p><a:pPr>'
+    '<a:defRPr sz="1000"%s/></a:pPr></a:p></c:txPr>'
+)
+_CHART_SHOW_FLAGS_XML = (
+    '<c:showLegendKey val="0"/><c:showVal val="%d"/><c:showCatName val="0"/>'
+    '<c:showSerName val="0"/><c:showPercent val="0"/><c:showBubbleSize val="0"/>'
+)
+
+
+def _chart_fragment(xml):
+    """Parse a chart XML fragment into an oxml element."""
+    from pptx.oxml import parse_xml
+    return parse_xml(xml)
+
+
+def _compile_dpt_fragments(palette):
+    """Return one `c:dPt` element per palette colour (idx filled in on apply)."""
+    from pptx.oxml.ns import nsdecls
+    return [
+        _chart_fragment(
+            '<c:dPt %s><c:idx val="0"/><c:spPr><a:solidFill><a:srgbClr val="%s"/>'
+            '</a:solidFill></c:spPr></c:dPt>' % (nsdecls("c", "a"), color)
+        )
+        for color in palette
+    ]
+
+
+def _compile_column_preset(palette):
+    """Compile the XML fragments for a styled column chart."""
+    from pptx.oxml.ns import nsdecls
+    decls = nsdecls("c", "a")
+    return {
+        "kind": "column",
+        "axis_txPr": _chart_fragment(_CHART_FONT_TXPR_XML % (decls, "")),
+        "value_numFmt": _chart_fragment('<c:numFmt %s formatCode="0" sourceLinked="0"/>' % decls),
+        "plot_dLbls": _chart_fragment(
+            '<c:dLbls %s><c:numFmt formatCode="0.0" sourceLinked="0"/>%s'
+            '<c:dLblPos val="outEnd"/>%s<c:showLeaderLines val="1"/></c:dLbls>'
+            % (decls, _CHART_FONT_TXPR_XML % ("", ' b="0"'), _CHART_SHOW_FLAGS_XML % 1)
+        ),
+        "dPts": _compile_dpt_fragments(palette),
+    }
+
+
+def _compile_doughnut_preset(palette):
+    """Compile the XML fragments for a styled doughnut chart."""
+    from pptx.oxml.ns import nsdecls
+    decls = nsdecls("c", "a")
+    return {
+        "kind": "doughnut",
+        "legend": _chart_fragment(
+            '<c:legend %s><c:legendPos val="b"/><c:layout/><c:overlay val="0"/>%s</c:legend>'
+            % (decls, _CHART_FONT_TXPR_XML % ("", ""))
+        ),
+        "plot_dLbls": _chart_fragment(
+            '<c:dLbls %s>%s%s<c:showLeaderLines val="1"/></c:dLbls>'
+            % (decls, _CHART_FONT_TXPR_XML % ("", ""), _CHART_SHOW_FLAGS_XML % 0)
+        ),
+        "series_dLbls": _chart_fragment(
+            '<c:dLbls %s>%s<c:showLeaderLines val="1"/></c:dLbls>'
+            % (decls, _CHART_SHOW_FLAGS_XML % 0)
+        ),
+        "point_dLbl": _chart_fragment(
+            '<c:dLbl %s><c:idx val="0"/><c:tx><c:rich><a:bodyPr/><a:lstStyle/><a:p>'
+            '<a:r><a:rPr sz="1000"/><a:t></a:t></a:r></a:p></c:rich></c:tx>%s</c:dLbl>'
+            % (decls, _CHART_SHOW_FLAGS_XML % 1)
+        ),
+        "dPts": _compile_dpt_fragments(palette),
+    }
+
+
+def _compile_chart_style_presets():
+    presets = {
+        "historical_column": _compile_column_preset(COLUMN_CHART_PALETTE),
+        "forecast_column": _compile_column_preset(COLUMN_CHART_PALETTE),
+    }
+    for sheet_name, palette in DOUGHNUT_CHART_PALETTES.items():
+        presets["doughnut_" + sheet_name] = _compile_doughnut_preset(palette)
+    return presets
+
+
+# Compiled once at import; applying a preset only deep-copies these fragments
+CHART_STYLE_PRESETS = _compile_chart_style_presets()
+
+
+def column_preset_name(chart_type_name):
+    """Return the column preset for 'historical' or 'forecast', defaulting to historical."""
+    name = f"{chart_type_name}_column"
+    if name not in CHART_STYLE_PRESETS:
+        print(f"Warning: no column chart style '{name}', using historical_column")
+        return "historical_column"
+    return name
+
+
+def doughnut_preset_name(sheet_name):
+    """Return the doughnut preset for a data sheet, defaulting to By_Type colours."""
+    name = "doughnut_" + str(sheet_name)
+    return name if name in CHART_STYLE_PRESETS else "doughnut_By_Type"
+
+
+def _column_axis_scale(values):
+    """Return (axis_max, interval) giving 8 round intervals from 0 to max(values)."""
+    max_value = max(values)
+    interval = nice_number(max_value / 8)
+    axis_max = math.ceil(max_value / interval) * interval
+    return axis_max, interval
+
+
+def _set_point_fills(ser, dPt_fragments, point_count, cycle):
+    """Replace the series' data-point fills with copies of the preset fragments."""
+    for dPt in list(ser.dPt_lst):
+        ser.remove(dPt)
+    count = point_count if cycle else min(point_count, len(dPt_fragments))
+    for i in range(count):
+        dPt = deepcopy(dPt_fragments[i % len(dPt_fragments)])
+        dPt.idx.val = i
+        ser._insert_dPt(dPt)
+
+
+def _apply_column_preset(chart_space, preset, values):
+    plot_area = chart_space.plotArea
+    for axis in plot_area.xpath("c:catAx | c:valAx"):
+        axis._remove_majorGridlines()
+        axis._remove_minorGridlines()
+        axis._remove_txPr()
+        axis._insert_txPr(deepcopy(preset["axis_txPr"]))
+
+    if values:
+        axis_max, interval = _column_axis_scale(values)
+        for value_axis in chart_space.valAx_lst:
+            value_axis.scaling.minimum = 0
+            value_axis.scaling.maximum = axis_max
+            value_axis._remove_majorUnit()
+            value_axis._add_majorUnit(val=interval)
+            value_axis._remove_numFmt()
+            value_axis._insert_numFmt(deepcopy(preset["value_numFmt"]))
+
+    for bar_chart in plot_area.xpath("c:barChart"):
+        bar_chart._remove_dLbls()
+        bar_chart._insert_dLbls(deepcopy(preset["plot_dLbls"]))
+
+    sers = plot_area.sers
+    if sers:
+        _set_point_fills(sers[0], preset["dPts"], len(values), cycle=True)
+
+
+def _apply_doughnut_preset(chart_space, preset, values):
+    chart = chart_space.chart
+    chart._remove_legend()
+    chart._insert_legend(deepcopy(preset["legend"]))
+
+    for doughnut in chart_space.plotArea.xpath("c:doughnutChart"):
+        doughnut._remove_dLbls()
+        doughnut._insert_dLbls(deepcopy(preset["plot_dLbls"]))
+
+    sers = chart_space.plotArea.sers
+    if not sers:
+        return
+    ser = sers[0]
+
+    # Fixed one-decimal percentage text on each point
+    dLbls = deepcopy(preset["series_dLbls"])
+    for i, value in enumerate(values):
+        dLbl = deepcopy(preset["point_dLbl"])
+        dLbl.idx.val = i
+        dLbl.xpath(".//a:t")[0].text = f"{value:.1f}%"
+        dLbls.insert(i, dLbl)
+    ser._remove_dLbls()
+    ser._insert_dLbls(dLbls)
+
+    _set_point_fills(ser, preset["dPts"], len(values), cycle=False)
+
+
+def apply_chart_style_preset(chart_space, preset_name, values):
     """
-    Enhanced formatting for column charts to match template style:
-    - 8 Y-axis values instead of default 5
-    - No gridlines
-    - Data labels above bars
-    - Font size 10 for axis labels
-    - Different colors for historical vs forecast
+    Splice a precompiled style preset into a `c:chartSpace` element.
+    Column presets style axes, data labels and bar colours; doughnut presets
+    style the legend, percentage labels and segment colours.
     """
-    try:
-        # Remove gridlines
-        if chart.plots and len(chart.plots) > 0:
-            plot = chart.plots[0]
-            
-            # Remove major gridlines
-            try:
-                if hasattr(plot, 'has_major_gridlines'):
-                    plot.has_major_gridlines = False
-            except:
-                pass
-            
-            # Alternative approach for gridlines
-            try:
-                if hasattr(chart, 'category_axis'):
-                    chart.category_axis.has_major_gridlines = False
-                    chart.category_axis.has_minor_gridlines = False
-                if hasattr(chart, 'value_axis'):
-                    chart.value_axis.has_major_gridlines = False
-                    chart.value_axis.has_minor_gridlines = False
-            except:
-                pass
-        
-        print("✅ Gridlines removed")
-    except Exception as e:
-        print(f"Warning: Could not remove gridlines: {e}")
-    
-    try:
-        # Configure Y-axis with 8 intervals and font size
-        if hasattr(chart, 'value_axis') and values:
-            value_axis = chart.value_axis
-            
-            # Calculate proper axis range
-            max_value = max(values)
-            min_value = 0  # Start from 0
-            
-            # Calculate nice round numbers for 8 intervals
-            range_val = max_value - min_value
-            interval = nice_number(range_val / 8)  # 8 intervals
-            axis_max = math.ceil(max_value / interval) * interval
-            
-            # Set axis properties
-            value_axis.minimum_scale = min_value
-            value_axis.maximum_scale = axis_max
-            value_axis.major_unit = interval
-            
-            # Format Y-axis labels
-            value_axis.tick_labels.number_format = '0'
-            if hasattr(value_axis.tick_labels, 'font'):
-                value_axis.tick_labels.font.size = Pt(10)
-            
-            print(f"✅ Y-axis configured: 0 to {axis_max} with interval {interval}, font size 10")
-            
-    except Exception as e:
-        print(f"Warning: Could not configure Y-axis: {e}")
-    
-    try:
-        # Configure X-axis font size
-        if hasattr(chart, 'category_axis'):
-            category_axis = chart.category_axis
-            if hasattr(category_axis.tick_labels, 'font'):
-                category_axis.tick_labels.font.size = Pt(10)
-            print("✅ X-axis labels font size set to 10")
-    except Exception as e:
-        print(f"Warning: Could not configure X-axis font: {e}")
-    
-    try:
-        # Add data labels above bars
-        if chart.plots and len(chart.plots) > 0:
-            plot = chart.plots[0]
-            plot.has_data_labels = True
-            
-            data_labels = plot.data_labels
-            data_labels.show_value = True
-            data_labels.show_category_name = False
-            data_labels.show_series_name = False
-            data_labels.show_percentage = False
-            
-            # Position labels above bars
-            try:
-                data_labels.position = XL_DATA_LABEL_POSITION.OUTSIDE_END
-            except:
-                pass
-            
-            # Format data labels
-            try:
-                if hasattr(data_labels, 'font'):
-                    data_labels.font.size = Pt(10)
-                    data_labels.font.bold = False
-                
-                # Set number format for data labels (no decimals for whole numbers)
-                if hasattr(data_labels, 'number_format'):
-                    data_labels.number_format = '0.0'  # Show one decimal place
-                    
-            except Exception as e:
-                print(f"Warning: Could not format data labels: {e}")
-                
-        print("✅ Data labels added above bars")
-        
-    except Exception as e:
-        print(f"Warning: Could not add data labels: {e}")
-    
-    try:
-        # Style the chart series (bars) with different colors for each bar
-        if chart.series and len(chart.series) > 0:
-            series = chart.series[0]
-            
-            # Define a color palette with distinct colors for each bar
-            color_palette = [
-                RGBColor(68, 114, 196),    # Blue
-                RGBColor(112, 173, 71),    # Green
-                RGBColor(237, 125, 49),    # Orange
-                RGBColor(165, 165, 165),   # Gray
-                RGBColor(255, 192, 0),     # Yellow
-                RGBColor(91, 155, 213),    # Light Blue
-                RGBColor(146, 208, 80),    # Light Green
-                RGBColor(255, 102, 0),     # Bright Orange
-                RGBColor(192, 192, 192),   # Silver
-                RGBColor(255, 255, 0)      # Bright Yellow
-            ]
-            
-            # Apply different colors to each bar
-            try:
-                for i, point in enumerate(series.points):
-                    # Cycle through the color palette
-                    color_index = i % len(color_palette)
-                    point.format.fill.solid()
-                    point.format.fill.fore_color.rgb = color_palette[color_index]
-                    
-                print(f"✅ Applied different colors to {len(series.points)} bars")
-            except Exception as e:
-                print(f"Warning: Could not apply colors to bars: {e}")
-                
-    except Exception as e:
-        print(f"Warning: Could not style chart series: {e}")
+    preset = CHART_STYLE_PRESETS[preset_name]
+    if preset["kind"] == "column":
+        _apply_column_preset(chart_space, preset, values)
+    else:
+        _apply_doughnut_preset(chart_space, preset, values)
+
+
+# --------------- chart render cache ---------------
+
+class ChartRenderCache:
+    """
+    Process-wide LRU cache of finished chart parts: the styled chart XML and
+    the embedded workbook blob. Bounded by total blob size in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, chart_xml, xlsx_blob):
+        size = len(chart_xml) + len(xlsx_blob)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0]) + len(old[1])
+            self._entries[key] = (chart_xml, xlsx_blob)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (old_xml, old_xlsx) = self._entries.popitem(last=False)
+                self._size -= len(old_xml) + len(old_xlsx)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+CHART_RENDER_CACHE = ChartRenderCache(int(os.environ.get('CHART_CACHE_MAX_BYTES', 32 * 1024 * 1024)))
+
+
+def chart_render_key(chart_kind, categories, values, preset_name):
+    """Cache key identifying a finished chart by its data and style."""
+    return (
+        chart_kind,
+        tuple(str(c) for c in categories),
+        tuple(float(v) for v in values),
+        preset_name,
+    )
+
+
+CHART_TYPES_BY_KIND = {
+    "column": XL_CHART_TYPE.COLUMN_CLUSTERED,
+    "doughnut": XL_CHART_TYPE.DOUGHNUT,
+}
+
+
+def build_chart_blobs(chart_kind, categories, values, preset_name):
+    """Return (chart_xml, xlsx_blob) for a chart with `preset_name` styling applied."""
+    chart_data = CategoryChartData()
+    chart_data.categories = categories
+    chart_data.add_series("", tuple(values))
+
+    chart_space = parse_xml(chart_data.xml_bytes(CHART_TYPES_BY_KIND[chart_kind]))
+    apply_chart_style_preset(chart_space, preset_name, values)
+    return serialize_part_xml(chart_space), chart_data.xlsx_blob
+
+
+def add_chart_from_blobs(slide, chart_xml, xlsx_blob, x, y, cx, cy):
+    """Add a chart graphic frame to `slide` backed by a prebuilt chart part."""
+    package = slide.part.package
+    chart_part = ChartPart.load(
+        package.next_partname(ChartPart.partname_template), CT.DML_CHART, package, chart_xml
+    )
+    chart_part.chart_workbook.update_from_xlsx_blob(xlsx_blob)
+    rId = slide.part.relate_to(chart_part, RT.CHART)
+
+    shapes = slide.shapes
+    graphicFrame = shapes._add_chart_graphicFrame(rId, x, y, cx, cy)
+    shapes._recalculate_extents()
+    return shapes._shape_factory(graphicFrame)
+
+
+# --------------- parallel chart build ---------------
+
+CHART_BUILD_WORKERS = int(os.environ.get('CHART_BUILD_WORKERS', os.cpu_count() or 1))
+
+_chart_build_pool = None
+_chart_build_pool_lock = threading.Lock()
+
+
+def _get_chart_build_pool():
+    """Return the shared process pool used to build chart parts, starting it if needed."""
+    global _chart_build_pool
+    with _chart_build_pool_lock:
+        if _chart_build_pool is None:
+            _chart_build_pool = ProcessPoolExecutor(
+                max_workers=CHART_BUILD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _chart_build_pool
+
+
+def _reset_chart_build_pool():
+    global _chart_build_pool
+    with _chart_build_pool_lock:
+        if _chart_build_pool is not None:
+            _chart_build_pool.shutdown(wait=False)
+            _chart_build_pool = None
+
+
+def build_chart_jobs(chart_jobs):
+    """
+    Build chart parts for every job, storing (chart_xml, xlsx_blob) in job["blobs"].
+    Cached parts are reused; the rest are built once per distinct key in the
+    chart process pool, falling back to building in-process.
+    """
+    pending = OrderedDict()
+    for job in chart_jobs:
+        key = chart_render_key(job["chart_kind"], job["categories"], job["values"], job["preset_name"])
+        cached = CHART_RENDER_CACHE.get(key)
+        if cached is not None:
+            job["blobs"] = cached
+        else:
+            pending.setdefault(key, []).append(job)
+
+    print(f"Chart build: {len(chart_jobs)} chart(s), {len(pending)} to build")
+    if not pending:
+        return
+
+    specs = OrderedDict(
+        (key, (jobs[0]["chart_kind"], jobs[0]["categories"], jobs[0]["values"], jobs[0]["preset_name"]))
+        for key, jobs in pending.items()
+    )
+    results = {}
+
+    # Daemonic processes (e.g. pool workers) cannot start a pool of their own
+    use_pool = CHART_BUILD_WORKERS > 1 and len(specs) > 1 and not multiprocessing.current_process().daemon
+    if use_pool:
+        try:
+            pool = _get_chart_build_pool()
+            futures = OrderedDict((key, pool.submit(build_chart_blobs, *spec)) for key, spec in specs.items())
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f"Warning: Chart build failed in worker, retrying in-process: {e}")
+        except Exception as e:
+            print(f"Warning: Chart build pool unavailable, building in-process: {e}")
+            _reset_chart_build_pool()
+
+    for key, spec in specs.items():
+        if key in results:
+            continue
+        try:
+            results[key] = build_chart_blobs(*spec)
+        except Exception as e:
+            print(f"❌ Failed to build {spec[0]} chart: {e}")
+
+    for key, blobs in results.items():
+        CHART_RENDER_CACHE.put(key, *blobs)
+        for job in pending[key]:
+            job["blobs"] = blobs
+
 
 def update_charts_in_slide_enhanced_fixed(
     slide,
@@ -2959,6 +4673,22 @@ def update_charts_in_slide_enhanced_fixed(
     """
     Updated version with enhanced column chart formatting
     """
+    chart_jobs = collect_chart_jobs_in_slide(slide, slide_idx, volumes, historical_years, forecast_years, excel_path)
+    build_chart_jobs(chart_jobs)
+    attach_chart_jobs(slide, chart_jobs, unit, historical_years, forecast_years)
+
+def collect_chart_jobs_in_slide(
+    slide,
+    slide_idx,
+    volumes,
+    historical_years=[2019, 2020, 2021, 2022, 2023, 2024],
+    forecast_years=[2025, 2026, 2027, 2028, 2029, 2030, 2031, 2032, 2033],
+    excel_path=None
+):
+    """
+    Identify the charts on a slide that need recreating and return one job per
+    chart with its data, style preset and position. Nothing is modified yet.
+    """
     charts_to_recreate = []
 
     # ---------- First pass: identify charts and their properties ----------
@@ -3013,6 +4743,9 @@ def update_charts_in_slide_enhanced_fixed(
                 "shape": shape,
                 "chart_kind": "column",
                 "years": years,
+                "categories": [str(year) for year in years],
+                "values": [float(volumes.get(year, 0)) for year in years],
+                "preset_name": column_preset_name(chart_type_name),
                 "chart_type_name": chart_type_name,
                 "title": title_text,
                 "is_historical": is_historical,
@@ -3062,6 +4795,9 @@ def update_charts_in_slide_enhanced_fixed(
                 "chart_type": XL_CHART_TYPE.DOUGHNUT,
                 "title": title_text,
                 "data": percentage_data,
+                "categories": [name for name, _ in percentage_data],
+                "values": [float(val) for _, val in percentage_data],
+                "preset_name": doughnut_preset_name(sheet_name),
                 "latest_year": latest_year,
                 "sheet_name": sheet_name,
                 "description": description,
@@ -3073,12 +4809,29 @@ def update_charts_in_slide_enhanced_fixed(
             charts_to_recreate.append(chart_info)
             print(f"Queued doughnut chart for recreation with {sheet_name} data")
 
-    # ---------- Second pass: recreate charts ----------
-    for chart_info in charts_to_recreate:
+    return charts_to_recreate
+
+def attach_chart_jobs(
+    slide,
+    chart_jobs,
+    unit,
+    historical_years=[2019, 2020, 2021, 2022, 2023, 2024],
+    forecast_years=[2025, 2026, 2027, 2028, 2029, 2030, 2031, 2032, 2033]
+):
+    """
+    Replace each collected chart on `slide` with its prebuilt chart part.
+    Jobs whose part could not be built keep their original chart.
+    """
+    for chart_info in chart_jobs:
+        if not chart_info.get("blobs"):
+            print(f"❌ Failed to recreate chart: no chart part built for '{chart_info.get('title', '')}'")
+            continue
+        chart_xml, xlsx_blob = chart_info["blobs"]
+
         try:
             # ================= Recreate COLUMN charts (ENHANCED) =================
             if chart_info.get("chart_kind") == "column":
-                volume_values = [float(volumes.get(year, 0)) for year in chart_info["years"]]
+                volume_values = chart_info["values"]
                 print(f"Recreating {chart_info['chart_type_name']} chart with data: {dict(zip(chart_info['years'], volume_values))}")
 
                 # Remove old shape
@@ -3086,25 +4839,18 @@ def update_charts_in_slide_enhanced_fixed(
                 shape_element = old_shape.element
                 slide.shapes._spTree.remove(shape_element)
 
-                # Build chart data
-                chart_data = CategoryChartData()
-                chart_data.categories = [str(year) for year in chart_info["years"]]
-                chart_data.add_series("", tuple(volume_values))
-
-                # Add new chart
-                new_chart_shape = slide.shapes.add_chart(
-                    XL_CHART_TYPE.COLUMN_CLUSTERED,
+                # Add new chart with enhanced formatting
+                new_chart_shape = add_chart_from_blobs(
+                    slide,
+                    chart_xml,
+                    xlsx_blob,
                     chart_info["left"],
                     chart_info["top"],
                     chart_info["width"],
                     chart_info["height"],
-                    chart_data,
                 )
                 new_chart = new_chart_shape.chart
 
-                # *** APPLY ENHANCED FORMATTING ***
-                format_column_chart_enhanced(new_chart, volume_values, unit, chart_info["chart_type_name"])
-
                 # Title + placeholders
                 try:
                     if chart_info.get("title"):
@@ -3121,12 +4867,9 @@ def update_charts_in_slide_enhanced_fixed(
 
                 print(f"✅ Successfully recreated {chart_info['chart_type_name']} chart with enhanced formatting")
 
-            # ================= DOUGHNUT CHART (unchanged) =================
+            # ================= DOUGHNUT CHART =================
             elif chart_info.get("chart_kind") == "doughnut":
-                # [Doughnut chart code remains the same as in your original script]
                 percentage_data = chart_info["data"]
-                labels = [name for name, _ in percentage_data]
-                values = [float(val) for _, val in percentage_data]
 
                 print(f"Creating doughnut chart from {chart_info['sheet_name']} ({chart_info['description']}) with data: {dict(percentage_data)}")
                 
@@ -3142,126 +4885,11 @@ def update_charts_in_slide_enhanced_fixed(
                     shape_element = old_shape.element
                     shape_element.getparent().remove(shape_element)
                     
-                    # Create chart data
-                    chart_data = CategoryChartData()
-                    chart_data.categories = labels
-                    chart_data.add_series("", tuple(values))
-                    
-                    # Create new chart
-                    new_chart_shape = slide.shapes.add_chart(
-                        XL_CHART_TYPE.DOUGHNUT,
-                        left, top, width, height,
-                        chart_data
-                    )
+                    # Create new chart with legend, percentage labels and segment colours
+                    new_chart_shape = add_chart_from_blobs(slide, chart_xml, xlsx_blob, left, top, width, height)
                     new_chart = new_chart_shape.chart
                     
-                    # Apply all the formatting (legend, hole size, data labels, colors, etc.)
-                    # 1. Legend at bottom
-                    try:
-                        new_chart.has_legend = True
-                        new_chart.legend.position = XL_LEGEND_POSITION.BOTTOM
-                        new_chart.legend.include_in_layout = False
-                        
-                        # Set legend font size to 10
-                        if new_chart.legend.font:
-                            new_chart.legend.font.size = Pt(10)
-                        
-                        print("✅ Legend positioned at bottom with proper spacing and font size 10")
-                    except Exception as e:
-                        print(f"Warning: Legend failed: {e}")
-                    
-                    # 2. Doughnut hole size
-                    try:
-                        if new_chart.plots and len(new_chart.plots) > 0:
-                            plot = new_chart.plots[0]
-                            if hasattr(plot, 'doughnut_hole_size'):
-                                plot.doughnut_hole_size = 60
-                                print("✅ Doughnut hole configured")
-                    except Exception as e:
-                        print(f"Warning: Hole size failed: {e}")
-                    
-                    # 3. Percentage data labels
-                    try:
-                        if new_chart.plots and len(new_chart.plots) > 0:
-                            plot = new_chart.plots[0]
-                            plot.has_data_labels = True
-                            data_labels = plot.data_labels
-                            
-                            # Turn off automatic percentage display
-                            data_labels.show_value = False
-                            data_labels.show_percentage = False
-                            data_labels.show_category_name = False
-                            data_labels.show_series_name = False
-                            
-                            # Set data labels font size to 10
-                            if data_labels.font:
-                                data_labels.font.size = Pt(10)
-                            
-                            # Manually set each data label with exact decimal formatting
-                            if new_chart.series and len(new_chart.series) > 0:
-                                series = new_chart.series[0]
-                                
-                                for i, (label, value) in enumerate(percentage_data):
-                                    if i < len(series.points):
-                                        point = series.points[i]
-                                        if hasattr(point, 'data_label'):
-                                            point.data_label.has_text_frame = True
-                                            point.data_label.text_frame.text = f"{value:.1f}%"
-                                            
-                                            # Set font size for individual data label
-                                            if point.data_label.text_frame.paragraphs:
-                                                para = point.data_label.text_frame.paragraphs[0]
-                                                if para.runs:
-                                                    para.runs[0].font.size = Pt(10)
-                            
-                            print("✅ Custom percentage labels configured with exact decimal values and font size 10")
-                    except Exception as e:
-                        print(f"Warning: Custom data labels failed: {e}")
-                    
-                    # 4. Colors (vary by data source for visual distinction)
-                    try:
-                        # Different color schemes for different data sources
-                        color_schemes = {
-                            "By_Type": [
-                                RGBColor(68, 114, 196),   # Blue
-                                RGBColor(112, 173, 71),   # Green
-                                RGBColor(255, 192, 0),    # Yellow
-                            ],
-                            "By_Application": [
-                                RGBColor(237, 125, 49),   # Orange
-                                RGBColor(165, 165, 165),  # Gray
-                                RGBColor(68, 114, 196),   # Blue
-                                RGBColor(112, 173, 71),   # Green
-                                RGBColor(255, 192, 0),    # Yellow
-                            ],
-                            "By_EndUser": [
-                                RGBColor(112, 173, 71),   # Green
-                                RGBColor(255, 192, 0),    # Yellow
-                                RGBColor(237, 125, 49),   # Orange
-                                RGBColor(165, 165, 165),  # Gray
-                                RGBColor(68, 114, 196),   # Blue
-                            ],
-                            "By_Region": [
-                                RGBColor(255, 192, 0),    # Yellow
-                                RGBColor(237, 125, 49),   # Orange
-                                RGBColor(68, 114, 196),   # Blue
-                            ]
-                        }
-                        
-                        colors = color_schemes.get(chart_info['sheet_name'], color_schemes["By_Type"])
-                        
-                        if new_chart.series and len(new_chart.series) > 0:
-                            series = new_chart.series[0]
-                            for i, point in enumerate(series.points):
-                                if i < len(colors):
-                                    point.format.fill.solid()
-                                    point.format.fill.fore_color.rgb = colors[i]
-                                    
-                            print(f"✅ Colors applied for {chart_info['sheet_name']} data")
-                    except Exception as e:
-                        print(f"Warning: Segment colors failed: {e}")
-                    
-                    # 5. Title with data source indication
+                    # Title with data source indication
                     try:
                         if chart_info.get("title"):
                             updated_title = chart_info["title"].replace("{{Latest_Year}}", str(chart_info["latest_year"]))
@@ -3327,14 +4955,239 @@ def debug_and_fix_charts(prs, volumes, unit):
             print(f"\nSlide {slide_idx + 1} has charts - testing updates...")
             simple_chart_update_test(slide, volumes, unit)
 
+# --------------- output writer ---------------
+
+# Deflate level for XML parts (0-9); media and embedded packages are stored as-is
+PPTX_COMPRESSLEVEL = int(os.environ.get('PPTX_COMPRESSLEVEL', '6'))
+
+# How the _backup.pptx copy is made from the saved deck: link, copy or none
+PPTX_BACKUP_MODE = os.environ.get('PPTX_BACKUP_MODE', 'link').strip().lower()
+
+# Payloads that are already compressed gain nothing from another deflate pass
+STORED_PART_EXTENSIONS = {
+    "png", "jpg", "jpeg", "jfif", "gif", "tif", "tiff", "wdp",
+    "mp3", "m4a", "mp4", "m4v", "mov", "wmv", "avi",
+    "xlsx", "xlsm", "docx", "pptx", "zip",
+}
+
+
+# Threads used to serialize and deflate parts concurrently at save time
+PPTX_SAVE_WORKERS = int(os.environ.get('PPTX_SAVE_WORKERS', min(8, os.cpu_count() or 1)))
+
+_save_pool = None
+_save_pool_lock = threading.Lock()
+
+
+def _get_save_pool():
+    global _save_pool
+    with _save_pool_lock:
+        if _save_pool is None:
+            _save_pool = ThreadPoolExecutor(max_workers=PPTX_SAVE_WORKERS, thread_name_prefix="pptx-save")
+        return _save_pool
+
+
+class ZipStreamWriter:
+    """
+    Minimal ZIP writer that appends entries whose CRC, sizes and compressed
+    payload are already known. Writes strictly sequentially, so `fileobj`
+    does not need to be seekable. ZIP64 is not supported.
+    """
+
+    _LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+    _CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+    _END_RECORD = struct.Struct("<4s4H2LH")
+
+    def __init__(self, fileobj):
+        self._fp = fileobj
+        self._offset = 0
+        self._central = []
+
+    @staticmethod
+    def compress(data, compress_type, compresslevel):
+        """Return (crc, payload) for `data` under `compress_type`."""
+        crc = zlib.crc32(data)
+        if compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+            data = compressor.compress(data) + compressor.flush()
+        return crc, data
+
+    def write_compressed(self, name, payload, crc, file_size, compress_type, date_time=None):
+        """Append an entry from an already-compressed `payload`."""
+        if max(self._offset, len(payload), file_size) > 0xFFFFFFFF or len(self._central) >= 0xFFFF:
+            raise ValueError("Package too large for a ZIP without ZIP64 extensions")
+
+        dt = date_time or time.localtime(time.time())[:6]
+        dos_time = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+        dos_date = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+        try:
+            name_bytes, flags = name.encode("ascii"), 0
+        except UnicodeEncodeError:
+            name_bytes, flags = name.encode("utf-8"), 0x800
+
+        header = self._LOCAL_HEADER.pack(
+            b"PK\003\004", 20, 0, flags, compress_type, dos_time, dos_date,
+            crc, len(payload), file_size, len(name_bytes), 0,
+        )
+        self._fp.write(header)
+        self._fp.write(name_bytes)
+        self._fp.write(payload)
+        self._central.append((name_bytes, flags, compress_type, dos_time, dos_date, crc, len(payload), file_size, self._offset))
+        self._offset += len(header) + len(name_bytes) + len(payload)
+
+    def write(self, name, data, compress_type=zipfile.ZIP_DEFLATED, compresslevel=6):
+        """Compress and append `data` as entry `name`."""
+        crc, payload = self.compress(data, compress_type, compresslevel)
+        self.write_compressed(name, payload, crc, len(data), compress_type)
+
+    def close(self):
+        """Write the central directory. The underlying file object is left open."""
+        start = self._offset
+        for name_bytes, flags, compress_type, dos_time, dos_date, crc, csize, usize, offset in self._central:
+            self._fp.write(self._CENTRAL_HEADER.pack(
+                b"PK\001\002", 20, 3, 20, 0, flags, compress_type, dos_time, dos_date,
+                crc, csize, usize, len(name_bytes), 0, 0, 0, 0, 0o600 << 16, offset,
+            ))
+            self._fp.write(name_bytes)
+            self._offset += self._CENTRAL_HEADER.size + len(name_bytes)
+        self._fp.write(self._END_RECORD.pack(
+            b"PK\005\006", 0, 0, len(self._central), len(self._central),
+            self._offset - start, start, 0,
+        ))
+        self._fp.flush()
+
+
+def iter_package_items(prs):
+    """
+    Yield (member_name, get_blob) for each item of the presentation package in
+    save order. `get_blob` serializes the item when called.
+    """
+    package = prs.part.package
+    parts = tuple(package.iter_parts())
+    yield CONTENT_TYPES_URI.membername, lambda: serialize_part_xml(_ContentTypesItem.xml_for(parts))
+    yield PACKAGE_URI.rels_uri.membername, lambda: package._rels.xml
+    for part in parts:
+        yield part.partname.membername, (lambda part=part: part.blob)
+        if part._rels:
+            yield part.partname.rels_uri.membername, (lambda part=part: part.rels.xml)
+
+
+def _zip_compress_type(member_name):
+    ext = member_name.rsplit(".", 1)[-1].lower()
+    return zipfile.ZIP_STORED if ext in STORED_PART_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _serialize_package_item(member_name, get_blob, compresslevel):
+    """Serialize and compress one package item; runs on the save thread pool."""
+    blob = get_blob()
+    compress_type = _zip_compress_type(member_name)
+    crc, payload = ZipStreamWriter.compress(blob, compress_type, compresslevel)
+    return member_name, payload, crc, len(blob), compress_type
+
+
+def write_presentation(prs, dest, compresslevel=None):
+    """
+    Serialize `prs` once, straight to `dest` (a path or a writable binary
+    stream such as a response body or cache file). Parts are serialized and
+    deflated concurrently, then written to the zip in package order.
+    """
+    level = PPTX_COMPRESSLEVEL if compresslevel is None else compresslevel
+    items = list(iter_package_items(prs))
+
+    if PPTX_SAVE_WORKERS > 1 and len(items) > 1:
+        pool = _get_save_pool()
+        entries = pool.map(lambda item: _serialize_package_item(item[0], item[1], level), items)
+    else:
+        entries = (_serialize_package_item(name, get_blob, level) for name, get_blob in items)
+
+    if isinstance(dest, str):
+        with open(dest, "wb") as f:
+            _write_zip_entries(f, entries)
+    else:
+        _write_zip_entries(dest, entries)
+
+
+def _write_zip_entries(fileobj, entries):
+    writer = ZipStreamWriter(fileobj)
+    for member_name, payload, crc, file_size, compress_type in entries:
+        writer.write_compressed(member_name, payload, crc, file_size, compress_type)
+    writer.close()
+
+
+def backup_output_file(output_path, backup_path, mode=None):
+    """
+    Make `backup_path` a hard link to (or copy of) the saved `output_path`.
+    Returns the backup path, or None when backups are disabled.
+    """
+    mode = PPTX_BACKUP_MODE if mode is None else mode
+    if mode == "none":
+        return None
+
+    if os.path.exists(backup_path):
+        os.remove(backup_path)
+    if mode == "link":
+        try:
+            os.link(output_path, backup_path)
+            return backup_path
+        except OSError:
+            pass  # cross-device or unsupported filesystem, copy instead
+    shutil.copyfile(output_path, backup_path)
+    return backup_path
+
 # --------------- main ---------------
 
-def main(excel_file, ppt_template, output_ppt, session_id=None):
-    """Main function to process PPT automation with progress tracking"""
-    # Set global session_id for progress tracking
-    if session_id:
-        globals()['CURRENT_SESSION_ID'] = session_id
-    
+def main(excel_file, ppt_template, output_ppt, session_id=None, progress_sink=None):
+    """
+    Main function to process PPT automation with progress tracking.
+    Progress goes to `progress_sink(session_id, step, status, message,
+    file_path)`, by default publish_progress(). Returns the job's metrics.
+    """
+    # Per-job state (session, progress sink, latency budget, metrics) for this call only
+    job = JobContext(session_id, progress_sink)
+    token = _current_job.set(job)
+    try:
+        _run_job(job, excel_file, ppt_template, output_ppt)
+    finally:
+        # Lookups abandoned at a deadline may still record failures
+        job.settle(JOB_SETTLE_SECONDS)
+        _current_job.reset(token)
+        if job.metrics:
+            print(f"Job metrics: {job.metrics_snapshot()}")
+    return job.metrics_snapshot()
+
+_generation_options = None
+
+def generation_options():
+    """
+    Settings besides the input files that change the generated deck, including
+    a hash of this module so a new release does not reuse older results.
+    """
+    global _generation_options
+    if _generation_options is None:
+        with open(__file__, "rb") as f:
+            code_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+        _generation_options = {
+            "code": code_hash,
+            "ai_model": AI_MODEL,
+            "ai_cache_mode": AI_CACHE_MODE,
+            "company_fallback": COMPANY_FALLBACK_BACKEND,
+        }
+    return dict(_generation_options)
+
+# Job metrics that mean some content fell back to non-AI (or missing) text
+DEGRADED_JOB_METRICS = (
+    "ai_failures",
+    "ai_fallbacks",
+    "ai_unavailable",
+    "company_fallbacks",
+    "enrichment_failures",
+    "unsettled_tasks",
+)
+
+def job_output_degraded(metrics):
+    """True if AI content or company details fell back to non-AI text."""
+    return any(metrics.get(metric) for metric in DEGRADED_JOB_METRICS)
+
+def _run_job(job, excel_file, ppt_template, output_ppt):
     try:
         # Step 2: Reading Excel data
         update_step_progress(2, 'active', 'Loading Excel workbook...')
@@ -3342,8 +5195,12 @@ def main(excel_file, ppt_template, output_ppt, session_id=None):
         kv = read_summary_keys(excel_file, "Summary")
         update_step_progress(2, 'active', 'Extracting dynamic placeholders...')
         
-        dynamic_kv, volumes, use_ai = extract_dynamic_placeholders(excel_file, include_market_overview=True, include_overview_content=True)
+        dynamic_kv, volumes, use_ai = extract_dynamic_placeholders(excel_file, include_market_overview=False, include_overview_content=False)
         kv.update(dynamic_kv)
+
+        # AI narratives run in the background and are awaited only when their placeholders are replaced
+        ai_deadline = job.deadline("ai_content")
+        ai_futures = start_ai_content_generation(excel_file, dynamic_kv, use_ai=use_ai, deadline=ai_deadline)
         kv["Subtitle"] = build_report_subtitle(excel_file)
         
         update_step_progress(2, 'completed', 'Excel data loaded successfully')
@@ -3369,8 +5226,8 @@ def main(excel_file, ppt_template, output_ppt, session_id=None):
 
         # Step 4: AI Content (if enabled)
         update_step_progress(4, 'active', 'Processing AI content...')
-        # AI processing happens within the functions, so just mark as completed
-        update_step_progress(4, 'completed', 'AI content processing complete')
+        # AI content is generated in the background and awaited in step 6
+        update_step_progress(4, 'completed', 'AI content generation started')
 
         # Step 5: Loading PowerPoint template
         update_step_progress(5, 'active', 'Opening PowerPoint template...')
@@ -3395,6 +5252,11 @@ def main(excel_file, ppt_template, output_ppt, session_id=None):
 
         update_step_progress(6, 'active', 'Processing slide content...')
         
+        # Chart recreation is collected per slide and built in one batch below
+        historical_years = list(range(2019, 2025))  # 2019-2024
+        forecast_years = list(range(2025, 2034))    # 2025-2033
+        chart_jobs_by_slide = []
+
         # Process all slides for replacements
         total_slides = len(prs.slides)
         for slide_idx, slide in enumerate(prs.slides):
@@ -3413,28 +5275,41 @@ def main(excel_file, ppt_template, output_ppt, session_id=None):
                 if items:
                     replace_list_placeholder_in_slide(slide, placeholder, items)
 
-            # Text placeholders (includes inline keys)
+            # Text placeholders (includes inline keys); AI content is filled in once ready
             for key, val in kv.items():
+                if key in ai_futures:
+                    continue
                 placeholder = "{{" + key + "}}"
                 replace_text_placeholders_in_slide(slide, placeholder, val if val else "")
 
             # ENHANCED CHART UPDATES WITH SLIDE INDEX
-            historical_years = list(range(2019, 2025))  # 2019-2024
-            forecast_years = list(range(2025, 2034))    # 2025-2033
-            
             # Check if this slide has charts
             has_charts = any(shape.has_chart for shape in slide.shapes)
             if has_charts:
-                print(f"🔄 Recreating charts on slide {slide_idx + 1}...")
-                update_charts_in_slide_enhanced_fixed(
+                print(f"🔄 Collecting charts on slide {slide_idx + 1}...")
+                chart_jobs = collect_chart_jobs_in_slide(
                     slide, 
                     slide_idx,  # Pass slide index
                     volumes, 
-                    kv.get("Unit", ""), 
                     historical_years, 
                     forecast_years, 
                     excel_file
                 )
+                if chart_jobs:
+                    chart_jobs_by_slide.append((slide, chart_jobs))
+
+        if chart_jobs_by_slide:
+            update_step_progress(6, 'active', 'Building charts...')
+            build_chart_jobs([job for _, jobs in chart_jobs_by_slide for job in jobs])
+            for slide, chart_jobs in chart_jobs_by_slide:
+                attach_chart_jobs(slide, chart_jobs, kv.get("Unit", ""), historical_years, forecast_years)
+
+        update_step_progress(6, 'active', 'Waiting for AI content...')
+        ai_kv = resolve_ai_content(ai_futures, deadline=ai_deadline, fallback=fallback_ai_content(kv) if use_ai else None)
+        kv.update(ai_kv)
+        for slide in prs.slides:
+            for key, val in ai_kv.items():
+                replace_text_placeholders_in_slide(slide, "{{" + key + "}}", val)
 
         update_step_progress(6, 'completed', 'Placeholders updated successfully')
 
@@ -3443,25 +5318,27 @@ def main(excel_file, ppt_template, output_ppt, session_id=None):
         
         # Company table placeholders
         company_items = build_list_from_sheet(excel_file, "Company_Name")
-        distribute_company_names_across_template_slides(prs, "{{Company_Name_List}}", company_items, duplicate_if_needed=True, use_ai=use_ai)
+        distribute_company_names_across_template_slides(
+            prs, "{{Company_Name_List}}", company_items, duplicate_if_needed=True, use_ai=use_ai,
+            deadline=job.deadline("company_enrichment"),
+        )
         
         update_step_progress(7, 'completed', 'Charts and tables updated')
 
-        # Step 8: Saving presentation
-        update_step_progress(8, 'active', 'Creating backup...')
-        
-        # Save with a backup
-        backup_file = output_ppt.replace('.pptx', '_backup.pptx')
-        try:
-            prs.save(backup_file)
-            print(f"✅ Backup saved: {backup_file}")
-        except:
-            pass
-    
+        # Step 8: Saving presentation (serialized once, backup derived from the result)
         update_step_progress(8, 'active', 'Saving final presentation...')
-        prs.save(output_ppt)
+        write_presentation(prs, output_ppt)
         print(f"Presentation saved: {output_ppt}")
 
+        if isinstance(output_ppt, str):
+            update_step_progress(8, 'active', 'Creating backup...')
+            backup_file = output_ppt.replace('.pptx', '_backup.pptx')
+            try:
+                if backup_output_file(output_ppt, backup_file):
+                    print(f"✅ Backup saved: {backup_file}")
+            except Exception as e:
+                print(f"Warning: Could not create backup: {e}")
+
         # Add this debug line
         print("About to call update_step_progress(8, 'completed')")
 
@@ -3476,6 +5353,12 @@ def main(excel_file, ppt_template, output_ppt, session_id=None):
         raise
 
 if __name__ == "__main__":
+    # Pre-warm the company cache: python main_script.py prewarm-companies names.txt [--refresh]
+    if len(sys.argv) > 2 and sys.argv[1] == "prewarm-companies":
+        with open(sys.argv[2], encoding="utf-8") as f:
+            prewarm_company_cache(f.read().splitlines(), refresh="--refresh" in sys.argv[3:])
+        sys.exit(0)
+
     excel_file = "Datasheet-HS_test.xlsx"
     ppt_template = "test_ppt.pptx"
     output_ppt = "updated_presentation.pptx"
@@ -0,0 +1,181 @@
+"""
+Retention for uploaded inputs and generated decks.
+
+One background thread deletes files older than their folder's TTL (backups
+have their own, shorter one) and, when the folders together exceed a disk
+high-water mark, removes the oldest files until usage is back under the
+low-water mark. Files of jobs still running are held and never reaped. Holds
+live in a shared SQLite file, so a reaper in any gunicorn worker respects the
+jobs of every other worker.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from sqlite_util import open_shared_sqlite
+
+MB = 1024 * 1024
+
+
+class OutputReaper:
+    """
+    `folders` maps a directory to its TTL in seconds. Files whose name ends
+    in `backup_suffix` use `backup_ttl_seconds` instead. `max_bytes` (0 for
+    no limit) caps the total size of all folders. Holds are kept in the
+    SQLite file at `state_path`; one older than `hold_ttl_seconds` belongs to
+    a worker that died mid-job and is dropped.
+    """
+
+    def __init__(self, folders, backup_ttl_seconds, state_path, max_bytes=0, interval_seconds=60,
+                 backup_suffix='_backup.pptx', low_water=0.8, hold_ttl_seconds=6 * 3600):
+        self.folders = dict(folders)
+        self.backup_ttl_seconds = backup_ttl_seconds
+        self.state_path = state_path
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.backup_suffix = backup_suffix
+        self.low_water = low_water
+        self.hold_ttl_seconds = hold_ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._removed = 0
+        self._removed_bytes = 0
+        self._last_bytes = 0
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="output-reaper", daemon=True)
+                self._thread.start()
+        return self
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_shared_sqlite(
+                self.state_path,
+                "CREATE TABLE IF NOT EXISTS output_holds (path TEXT PRIMARY KEY, held_at REAL NOT NULL)",
+            )
+            self._local.conn = conn
+        return conn
+
+    def hold(self, *paths):
+        """Protect files of a running job from being reaped."""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO output_holds (path, held_at) VALUES (?, ?)",
+                [(p, now) for p in paths if p],
+            )
+
+    def release(self, *paths):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM output_holds WHERE path = ?", [(p,) for p in paths if p])
+        except sqlite3.Error as e:
+            print(f"Warning: output hold release failed: {e}")
+        # Freed files may be needed to get back under the high-water mark
+        if self.max_bytes:
+            self._wake.set()
+
+    def _held(self):
+        """Paths held by running jobs in any worker; stale holds are dropped."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM output_holds WHERE held_at < ?", (time.time() - self.hold_ttl_seconds,))
+            return {row[0] for row in conn.execute("SELECT path FROM output_holds")}
+
+    def discard(self, *paths):
+        """Delete files now (e.g. inputs of a finished job)."""
+        self.release(*paths)
+        for path in paths:
+            if path:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Could not cleanup {path}: {e}")
+            return
+        with self._lock:
+            self._removed += 1
+            self._removed_bytes += size
+        print(f"Successfully removed: {path}")
+
+    def _scan(self):
+        """(path, mtime, size, ttl) for every file in the managed folders."""
+        files = []
+        for folder, ttl in self.folders.items():
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                file_ttl = self.backup_ttl_seconds if entry.name.endswith(self.backup_suffix) else ttl
+                files.append((entry.path, stat.st_mtime, stat.st_size, file_ttl))
+        return files
+
+    def reap(self):
+        """One pass: expire files past their TTL, then enforce the disk high-water mark."""
+        now = time.time()
+        held = self._held()
+
+        kept = []
+        for path, mtime, size, ttl in self._scan():
+            if path not in held and now - mtime > ttl:
+                self._remove(path)
+            else:
+                kept.append((path, mtime, size))
+
+        total = sum(size for _, _, size in kept)
+        if self.max_bytes and total > self.max_bytes:
+            target = self.max_bytes * self.low_water
+            print(f"Output folders at {total / MB:.1f} MB, above the {self.max_bytes / MB:.1f} MB limit; removing oldest files")
+            for path, _, size in sorted(kept, key=lambda item: item[1]):
+                if total <= target:
+                    break
+                if path in held:
+                    continue
+                self._remove(path)
+                total -= size
+        with self._lock:
+            self._last_bytes = total
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"Warning: output reaper pass failed: {e}")
+
+    def stats(self):
+        try:
+            held = len(self._held())
+        except sqlite3.Error:
+            held = None
+        with self._lock:
+            return {
+                "held": held,
+                "removed": self._removed,
+                "removed_mb": round(self._removed_bytes / MB, 1),
+                "last_mb": round(self._last_bytes / MB, 1),
+                "max_mb": round(self.max_bytes / MB, 1),
+            }
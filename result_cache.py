@@ -0,0 +1,137 @@
+"""
+Content-addressed cache of generated decks.
+
+The key is a hash of the uploaded datasheet, the template and the generation
+options, so re-running unchanged inputs returns the earlier deck without
+running the pipeline (or any AI calls) again. Decks are stored as files in
+one directory shared by all gunicorn workers; the least recently used ones
+are evicted once the directory exceeds its size limit.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Decks stored as `<key>.pptx` in `directory`. A hit refreshes the file's
+    mtime, which is what eviction orders by; `max_bytes` of 0 disables the
+    cache.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(excel_path, ppt_path, options):
+        payload = json.dumps(
+            {"excel": file_sha256(excel_path), "template": file_sha256(ppt_path), "options": options},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pptx")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, dest_path):
+        """Copy the cached deck for `key` to `dest_path`. Returns False on a miss."""
+        if not self.enabled:
+            return False
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, dest_path)
+            os.utime(path)
+        except FileNotFoundError:
+            self._count(False)
+            return False
+        except OSError as e:
+            print(f"Warning: result cache read failed: {e}")
+            self._count(False)
+            return False
+        self._count(True)
+        return True
+
+    def put(self, key, src_path):
+        """Store the deck at `src_path` under `key`, then evict down to the size limit."""
+        if not self.enabled:
+            return
+        tmp_path = None
+        try:
+            # Write under a temporary name so readers never see a partial deck
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Warning: result cache write failed: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".pptx"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        entries = self._entries() if self.enabled else []
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(entries),
+                "mb": round(sum(size for _, size, _ in entries) / (1024 * 1024), 1),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            }
@@ -0,0 +1,21 @@
+"""
+SQLite helpers shared by the caches and stores that several threads, jobs and
+gunicorn workers use at once. Kept apart from main_script so the small
+infrastructure modules can use them without importing the pipeline.
+"""
+
+import sqlite3
+
+
+def open_shared_sqlite(path, *schema):
+    """
+    Open a SQLite connection in WAL mode so several threads, jobs and gunicorn
+    workers can share the file, creating tables from `schema` if needed.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the shared SQLite stores created at import time out of the working tree
+_STATE_DIR = tempfile.mkdtemp(prefix="ppt-tests-")
+for _var, _name in (
+    ("COMPANY_CACHE_PATH", "company_cache.sqlite3"),
+    ("AI_CACHE_PATH", "ai_cache.sqlite3"),
+    ("AI_STATE_PATH", "ai_state.sqlite3"),
+    ("JOB_STATE_PATH", "job_state.sqlite3"),
+):
+    os.environ.setdefault(_var, os.path.join(_STATE_DIR, _name))
+os.environ.setdefault("RESULT_CACHE_DIR", os.path.join(_STATE_DIR, "result_cache"))
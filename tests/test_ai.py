@@ -0,0 +1,315 @@
+import threading
+import time
+
+import anthropic
+import pytest
+
+import main_script as ms
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def api_error(error_type):
+    # Built without the HTTP request/response objects their constructors want
+    return error_type.__new__(error_type)
+
+
+@pytest.fixture
+def breaker(tmp_path):
+    return ms.AICircuitBreaker(str(tmp_path / "state.sqlite3"), window=60, min_calls=4,
+                               failure_rate=0.5, slow_seconds=5, cooldown=0.2)
+
+
+def test_breaker_opens_probes_and_closes(breaker):
+    for ok in (True, True, False, False):
+        assert breaker.allow()
+        breaker.record(ok, 0.1)
+    assert breaker.stats()["state"] == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.25)
+    assert breaker.allow()
+    # Only one caller gets the probe
+    assert not breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.stats()["state"] == "closed"
+
+
+def test_failed_probe_reopens(breaker):
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    time.sleep(0.25)
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.stats()["state"] == "open"
+    assert not breaker.allow()
+
+
+def test_slow_calls_count_as_bad(breaker):
+    for _ in range(4):
+        breaker.record(True, 6)
+    assert breaker.stats()["state"] == "open"
+
+
+def test_only_the_probe_changes_an_open_breaker(breaker):
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    assert breaker.stats()["state"] == "open"
+    open_for = breaker.stats()["open_for"]
+
+    # Late outcomes of calls that started before the breaker opened
+    for ok in (True, False):
+        late = threading.Thread(target=breaker.record, args=(ok, 0.1))
+        late.start()
+        late.join()
+        assert breaker.stats()["state"] == "open"
+    assert breaker.stats()["open_for"] <= open_for
+
+    time.sleep(0.25)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.stats()["state"] == "closed"
+
+
+@pytest.mark.parametrize("error, elapsed, counted", [
+    (StatusError(500), 0.1, True),
+    (StatusError(529), 0.1, True),
+    (StatusError(429), 0.1, True),
+    (StatusError(400), 0.1, False),
+    (StatusError(404), 0.1, False),
+    (api_error(anthropic.APIConnectionError), 0.1, True),
+    (api_error(anthropic.APITimeoutError), 2, False),
+    (api_error(anthropic.APITimeoutError), ms.AI_BREAKER_SLOW_SECONDS, True),
+    (ValueError("bad prompt"), 0.1, False),
+])
+def test_only_provider_failures_count(error, elapsed, counted):
+    assert ms._is_provider_failure(error, elapsed) is counted
+
+
+def test_unused_probe_is_released(breaker):
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    time.sleep(0.25)
+    assert breaker.allow()
+    assert not breaker.allow()
+    # The probe never reached the provider; the next caller may probe at once
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    def make(rpm, tpm):
+        limiter = ms.AIRateLimiter(str(tmp_path / "state.sqlite3"), rpm, tpm)
+        conn = limiter._connect()
+        conn.execute("UPDATE ai_rate_buckets SET requests = 0, tokens = 0, updated_at = ?", (time.time(),))
+        conn.commit()
+        return limiter
+    return make
+
+
+def test_limiter_waits_for_refill_without_polling(limiter, monkeypatch):
+    rpm_limiter = limiter(rpm=120, tpm=0)
+    refills = []
+    original = rpm_limiter._refill
+    monkeypatch.setattr(rpm_limiter, "_refill", lambda conn, now: refills.append(now) or original(conn, now))
+
+    started = time.time()
+    rpm_limiter.acquire(100)
+    rpm_limiter.acquire(100)
+    elapsed = time.time() - started
+    # Two requests at 2 per second, checked when due rather than every few ms
+    assert 0.9 <= elapsed < 1.5
+    assert len(refills) <= 6
+
+
+def test_limiter_serves_tickets_in_order(limiter):
+    rpm_limiter = limiter(rpm=600, tpm=0)
+    order = []
+
+    def caller(n):
+        rpm_limiter.acquire(1)
+        order.append(n)
+
+    threads = []
+    for n in range(4):
+        threads.append(threading.Thread(target=caller, args=(n,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
+
+
+def test_limiter_gives_up_before_deadline(limiter):
+    slow_limiter = limiter(rpm=6, tpm=0)
+    started = time.time()
+    with pytest.raises(ms.AIDeadlineExceeded):
+        slow_limiter.acquire(1, deadline=time.time() + 3)
+    assert time.time() - started < 0.5
+    assert slow_limiter.stats()["queued"] == 0
+
+
+def test_limiter_refunds_reservations(limiter):
+    token_limiter = limiter(rpm=60, tpm=6000)
+    conn = token_limiter._connect()
+    conn.execute("UPDATE ai_rate_buckets SET requests = 10, tokens = 1000, updated_at = ?", (time.time(),))
+    conn.commit()
+
+    token_limiter.acquire(800)
+    token_limiter.settle(800, 300)
+    assert 700 <= token_limiter.stats()["tokens_available"] < 720
+    token_limiter.acquire(500)
+    token_limiter.settle(500, 0, sent=False)
+    stats = token_limiter.stats()
+    assert 700 <= stats["tokens_available"] < 720
+    assert 9 <= stats["requests_available"] < 9.5
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.content = [type("Block", (), {"text": text})()]
+        self.usage = None
+
+
+class FakeStream:
+    def __init__(self, client, seconds, text):
+        self.client, self.seconds, self.text = client, seconds, text
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def close(self):
+        self.client.closed.append(self.text)
+        self.stopped.set()
+
+    def __iter__(self):
+        for i in range(20):
+            if self.stopped.wait(self.seconds / 20):
+                raise ConnectionError("stream closed")
+            yield i
+
+    def get_final_message(self):
+        return FakeMessage(self.text)
+
+
+class StalledStream(FakeStream):
+    """Sends no events for a long time and does not notice being closed."""
+
+    def __iter__(self):
+        time.sleep(3)
+        yield 0
+
+
+class FakeClient:
+    """
+    Replies take the next latency from `latencies` (None for a stalled stream);
+    streams record when they are closed.
+    """
+
+    def __init__(self, latencies):
+        self.latencies = list(latencies)
+        self.threads = []
+        self.closed = []
+        self.messages = self
+
+    def _next(self):
+        self.threads.append(threading.current_thread())
+        n = len(self.threads)
+        return self.latencies[n - 1], f"reply {n}"
+
+    def create(self, **kwargs):
+        seconds, text = self._next()
+        time.sleep(seconds)
+        return FakeMessage(text)
+
+    def stream(self, **kwargs):
+        seconds, text = self._next()
+        return (StalledStream if seconds is None else FakeStream)(self, seconds, text)
+
+
+@pytest.fixture
+def hedging(monkeypatch, tmp_path, breaker):
+    monkeypatch.setattr(ms, "AI_CIRCUIT_BREAKER", breaker)
+    monkeypatch.setattr(ms, "AI_RATE_LIMITER", ms.AIRateLimiter(str(tmp_path / "state.sqlite3"), 0, 0))
+    monkeypatch.setattr(ms, "AI_LATENCY", {})
+    monkeypatch.setattr(ms, "_ai_hedge_slots", threading.BoundedSemaphore(2))
+    histogram = ms.ai_latency_histogram("test")
+    for _ in range(ms.AI_HEDGE_MIN_SAMPLES):
+        histogram.record(0.1)
+
+    def call(latencies, reserved_tokens=10):
+        fake = FakeClient(latencies)
+        monkeypatch.setattr(ms, "client", fake)
+        started = time.time()
+        text = ms._ai_hedged_call("model", 10, [{"role": "user", "content": "hi"}], reserved_tokens, None, "test")
+        return text, time.time() - started, fake
+    return call
+
+
+def test_hedge_wins_and_primary_is_cancelled(hedging):
+    text, elapsed, fake = hedging([2.0, 0.05])
+    assert text == "reply 2"
+    assert elapsed < 1.0
+    # The primary's stream was closed before the call returned
+    assert "reply 1" in fake.closed
+
+
+def test_stalled_primary_does_not_hold_the_caller(hedging):
+    # No events at all from the primary: the caller still returns with the hedge
+    text, elapsed, fake = hedging([None, 0.05])
+    assert text == "reply 2"
+    assert elapsed < 0.1 + 0.05 + 0.3
+    assert "reply 1" in fake.closed
+
+
+def test_cancelled_primary_settles_its_reservation(hedging, limiter, monkeypatch):
+    token_limiter = limiter(rpm=60, tpm=1200)
+    conn = token_limiter._connect()
+    conn.execute("UPDATE ai_rate_buckets SET requests = 10, tokens = 1000, updated_at = ?", (time.time(),))
+    conn.commit()
+    monkeypatch.setattr(ms, "AI_RATE_LIMITER", token_limiter)
+
+    text, _, _ = hedging([2.0, 0.05], reserved_tokens=300)
+    assert text == "reply 2"
+    time.sleep(0.2)
+    # The hedge reports no usage and keeps its 300; the primary is charged its prompt only
+    assert 410 <= token_limiter.stats()["tokens_available"] < 425
+
+
+def test_fast_primary_is_not_hedged(hedging):
+    text, _, fake = hedging([0.02])
+    assert text == "reply 1"
+    assert len(fake.threads) == 1
+
+
+def test_hedge_timer_starts_when_primary_is_sent(hedging, monkeypatch):
+    # Time spent waiting for rate-limit capacity does not count towards the hedge threshold
+    monkeypatch.setattr(ms.AI_RATE_LIMITER, "acquire", lambda tokens, deadline=None: time.sleep(0.3))
+    text, _, fake = hedging([0.03])
+    assert text == "reply 1"
+    assert len(fake.threads) == 1
+
+
+def test_hedges_are_capped(hedging, monkeypatch):
+    monkeypatch.setattr(ms, "_ai_hedge_slots", threading.BoundedSemaphore(1))
+    ms._ai_hedge_slots.acquire()
+    text, elapsed, fake = hedging([0.4, 0.01])
+    assert text == "reply 1"
+    assert len(fake.threads) == 1
+
+
+def test_losing_hedge_is_cancelled(hedging):
+    text, elapsed, fake = hedging([0.3, 2.0])
+    assert text == "reply 1"
+    assert elapsed < 1.0
+    time.sleep(0.3)
+    assert "reply 2" in fake.closed
@@ -0,0 +1,95 @@
+import os
+import time
+import zipfile
+from concurrent.futures import Future
+from io import BytesIO
+
+import pytest
+
+os.environ.setdefault("JOB_RUNNER", "thread")
+os.environ.setdefault("SSE_MAX_STREAMS", "1")
+
+import app as app_module
+
+
+def _client():
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess["authenticated"] = True
+    return client
+
+
+def test_progress_streams_are_capped_per_worker():
+    client = _client()
+    first = client.get("/progress-stream/a", buffered=False)
+    assert first.status_code == 200
+    refused = client.get("/progress-stream/b")
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"]
+
+    first.close()
+    again = client.get("/progress-stream/c", buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_clients_behind_one_address_get_their_own_identity():
+    ids = set()
+    for _ in range(2):
+        client = app_module.app.test_client()
+        client.post("/login", data={"username": app_module.AUTH_USERNAME, "password": app_module.AUTH_PASSWORD})
+        with client.session_transaction() as sess:
+            ids.add(sess["client_id"])
+    assert len(ids) == 2
+
+
+def test_decks_stay_downloadable_until_they_expire(tmp_path):
+    deck = tmp_path / "deck.pptx"
+    deck.write_bytes(b"deck")
+    app_module.update_progress("done-job", 8, "completed", "Done", str(deck))
+    client = _client()
+    for _ in range(2):
+        response = client.get("/download-generated/done-job")
+        assert response.status_code == 200
+        assert response.data == b"deck"
+        response.close()
+    assert deck.exists()
+
+
+def test_batch_zip_over_the_cap_is_refused_before_extracting(tmp_path):
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        for idx in range(3):
+            zf.writestr(f"sheet{idx}.xlsx", b"x")
+    archive.seek(0)
+    with pytest.raises(ValueError):
+        app_module.extract_datasheets(archive, str(tmp_path), max_items=2)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_closed_batch_keeps_its_directory_until_running_jobs_finish(tmp_path):
+    batch_dir = tmp_path / "batch"
+    batch_dir.mkdir()
+    queued, running = Future(), Future()
+    running.set_running_or_notify_cancel()
+    app_module.close_batch(str(batch_dir), {queued: {}, running: {}})
+
+    assert queued.cancelled()
+    time.sleep(0.1)
+    assert batch_dir.exists()
+    running.set_result(None)
+    for _ in range(50):
+        if not batch_dir.exists():
+            break
+        time.sleep(0.05)
+    assert not batch_dir.exists()
+
+
+def test_rejected_jobs_carry_retry_after():
+    with app_module.app.app_context():
+        response = app_module.queue_rejection_response(app_module.TooManyJobs(30))
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "30"
+        response = app_module.queue_rejection_response(app_module.QueueFull(12))
+        assert response.status_code == 503
+        assert response.get_json()["retry_after"] == 12
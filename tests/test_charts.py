@@ -0,0 +1,122 @@
+import pytest
+from lxml import etree
+
+import main_script as ms
+
+NS = {
+    "c": "http://schemas.openxmlformats.org/drawingml/2006/chart",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+}
+
+
+def _chart(kind, categories, values, preset):
+    chart_xml, _ = ms.build_chart_blobs(kind, categories, values, preset)
+    return etree.fromstring(chart_xml)
+
+
+def _flags(dlbls):
+    return {child.tag.split("}")[1]: child.get("val") for child in dlbls if child.tag.split("}")[1].startswith("show")}
+
+
+def test_column_preset_name_falls_back_to_historical():
+    assert ms.column_preset_name("forecast") == "forecast_column"
+    assert ms.column_preset_name("historical") == "historical_column"
+    assert ms.column_preset_name("quarterly") == "historical_column"
+
+
+def test_doughnut_preset_name_falls_back_to_by_type():
+    assert ms.doughnut_preset_name("unknown sheet") == "doughnut_By_Type"
+
+
+def test_chart_render_key_depends_on_data_and_style_only():
+    key = ms.chart_render_key("column", [2019, 2020], [1, 2.5], "historical_column")
+    assert key == ms.chart_render_key("column", ["2019", "2020"], [1.0, 2.5], "historical_column")
+    assert key != ms.chart_render_key("column", [2019, 2020], [1, 2.5], "forecast_column")
+    assert key != ms.chart_render_key("column", [2019, 2020], [1, 3], "historical_column")
+    assert key != ms.chart_render_key("column", [2019, 2021], [1, 2.5], "historical_column")
+
+
+def test_charts_differing_only_in_title_are_built_once(monkeypatch):
+    monkeypatch.setattr(ms, "CHART_RENDER_CACHE", ms.ChartRenderCache(32 * 1024 * 1024))
+    monkeypatch.setattr(ms, "CHART_BUILD_WORKERS", 1)
+    built = []
+    build = ms.build_chart_blobs
+    monkeypatch.setattr(ms, "build_chart_blobs", lambda *spec: built.append(spec) or build(*spec))
+
+    jobs = [
+        {"chart_kind": "column", "categories": ["2019", "2020"], "values": [1.0, 2.0],
+         "preset_name": "historical_column", "title": title}
+        for title in ("Market Performance", "Historical Market Size")
+    ]
+    ms.build_chart_jobs(jobs)
+    assert len(built) == 1
+    assert jobs[0]["blobs"] is jobs[1]["blobs"]
+
+    jobs.append(dict(jobs[0], preset_name="forecast_column", blobs=None))
+    ms.build_chart_jobs(jobs)
+    assert len(built) == 2
+
+
+def test_column_preset_matches_baseline_formatting():
+    # Expected values are the output of the formatter the presets replaced
+    years = [str(year) for year in range(2019, 2025)]
+    chart = _chart("column", years, [12.3, 15.1, 17.9, 20.2, 22.8, 25.0], "historical_column")
+    assert chart.find(".//c:legend", NS) is None
+    fills = [fill.get("val") for fill in chart.findall(".//c:ser/c:dPt//a:srgbClr", NS)]
+    assert fills == ["4472C4", "70AD47", "ED7D31", "A5A5A5", "FFC000", "5B9BD5"]
+
+    dlbls = chart.find(".//c:barChart/c:dLbls", NS)
+    assert dlbls.find("c:numFmt", NS).get("formatCode") == "0.0"
+    assert dlbls.find("c:dLblPos", NS).get("val") == "outEnd"
+    assert dlbls.find(".//a:defRPr", NS).get("sz") == "1000"
+    assert _flags(dlbls) == {
+        "showLegendKey": "0", "showVal": "1", "showCatName": "0", "showSerName": "0",
+        "showPercent": "0", "showBubbleSize": "0", "showLeaderLines": "1",
+    }
+
+    scaling = chart.find(".//c:valAx/c:scaling", NS)
+    assert scaling.find("c:min", NS).get("val") == "0.0"
+    assert scaling.find("c:max", NS).get("val") == "25.0"
+    assert chart.find(".//c:valAx/c:majorUnit", NS).get("val") == "5.0"
+    # The workbook link is added when the part is attached, not by the preset
+    assert chart.find("c:externalData", NS) is None
+
+
+@pytest.mark.parametrize("sheet, data, fills, labels", [
+    ("By_Type", [("A", 45.5), ("B", 30.25), ("C", 24.25)],
+     ["4472C4", "70AD47", "FFC000"], ["45.5%", "30.2%", "24.2%"]),
+    ("By_Region", [("N", 50.0), ("S", 30.0), ("E", 15.0), ("W", 5.0)],
+     ["FFC000", "ED7D31", "4472C4"], ["50.0%", "30.0%", "15.0%", "5.0%"]),
+    ("By_Application", [("x", 60.0), ("y", 40.0)],
+     ["ED7D31", "A5A5A5"], ["60.0%", "40.0%"]),
+])
+def test_doughnut_presets_match_baseline_formatting(sheet, data, fills, labels):
+    categories = [name for name, _ in data]
+    values = [value for _, value in data]
+    chart = _chart("doughnut", categories, values, ms.doughnut_preset_name(sheet))
+
+    assert chart.find(".//c:legend/c:legendPos", NS).get("val") == "b"
+    assert chart.find(".//c:legend/c:overlay", NS).get("val") == "0"
+    assert chart.find(".//c:holeSize", NS).get("val") == "50"
+    assert [fill.get("val") for fill in chart.findall(".//c:ser/c:dPt//a:srgbClr", NS)] == fills
+
+    point_labels = chart.findall(".//c:ser/c:dLbls/c:dLbl", NS)
+    assert [label.find("c:idx", NS).get("val") for label in point_labels] == [str(i) for i in range(len(data))]
+    assert [label.find(".//a:t", NS).text for label in point_labels] == labels
+    for label in point_labels:
+        assert label.find(".//a:rPr", NS).get("sz") == "1000"
+        assert _flags(label) == {
+            "showLegendKey": "0", "showVal": "1", "showCatName": "0", "showSerName": "0",
+            "showPercent": "0", "showBubbleSize": "0",
+        }
+    assert _flags(chart.find(".//c:ser/c:dLbls", NS))["showVal"] == "0"
+    assert _flags(chart.find(".//c:doughnutChart/c:dLbls", NS))["showLeaderLines"] == "1"
+    assert chart.find("c:externalData", NS) is None
+
+
+def test_build_chart_blobs_for_every_preset():
+    for name in ms.CHART_STYLE_PRESETS:
+        kind = "doughnut" if name.startswith("doughnut_") else "column"
+        chart_xml, xlsx_blob = ms.build_chart_blobs(kind, ["a", "b", "c"], [1.0, 2.0, 3.0], name)
+        assert chart_xml.startswith(b"<?xml") or b"chartSpace" in chart_xml
+        assert xlsx_blob[:2] == b"PK"
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+
+import pytest
+
+import main_script as ms
+
+
+@pytest.mark.parametrize("name, key", [
+    ("BASF SE", "basf"),
+    ("Dow Inc.", "dow"),
+    ("  Sumitomo   Chemical Co., Ltd. ", "sumitomo chemical"),
+    ("Société Générale S.A.", "societe generale"),
+    ("Johnson & Johnson", "johnson and johnson"),
+    ("Group", "group"),
+])
+def test_normalize_company_key(name, key):
+    assert ms.normalize_company_key(name) == key
+
+
+def test_company_cache_round_trip_and_ttl(tmp_path):
+    cache = ms.CompanyDetailsCache(str(tmp_path / "companies.sqlite3"), ttl_days=1)
+    details = {"founding_year": "1865", "headquarters": "Ludwigshafen", "website": "", "products_offered": []}
+    cache.put("BASF SE", details)
+    assert cache.get("basf") == details
+    assert cache.get("Unknown Corp") is None
+    assert cache.stats()["hits"] == 1
+
+    expired = ms.CompanyDetailsCache(cache.path, ttl_days=0)
+    assert expired.get("BASF") is None
+
+    cache.invalidate(["BASF"])
+    assert cache.get("BASF") is None
+
+
+@pytest.fixture
+def fake_ai(monkeypatch, tmp_path):
+    """Batch replies resolve only the first company; single lookups take 0.3 s each."""
+    calls = {"batch": 0, "single": 0}
+    lock = threading.Lock()
+
+    def ai_complete(prompt, max_tokens, model=None, deadline=None, label="default"):
+        with lock:
+            calls["single" if label == "company" else "batch"] += 1
+        if label == "company_batch":
+            names = json.loads(prompt.split("companies:", 1)[1].split("Return", 1)[0])
+            return json.dumps([{"company": names[0], "founding_year": "1900", "headquarters": "X"}])
+        time.sleep(0.3)
+        return json.dumps({"founding_year": "1950", "headquarters": "Y"})
+
+    monkeypatch.setattr(ms, "ai_complete", ai_complete)
+    monkeypatch.setattr(ms, "ai_available", lambda: True)
+    monkeypatch.setattr(ms, "COMPANY_FALLBACK_BACKEND", "none")
+    monkeypatch.setattr(ms, "COMPANY_DETAILS_CACHE", ms.CompanyDetailsCache(str(tmp_path / "c.sqlite3"), 1))
+    return calls
+
+
+def test_batch_misses_are_retried_concurrently(fake_ai):
+    names = [f"Company {i}" for i in range(6)]
+    started = time.time()
+    details = ms.enrich_companies(names, max_workers=8, batch_size=6)
+    elapsed = time.time() - started
+
+    assert details["Company 0"]["founding_year"] == "1900"
+    assert all(details[n]["founding_year"] == "1950" for n in names[1:])
+    assert fake_ai == {"batch": 1, "single": 5}
+    # Five 0.3 s retries run side by side, not one after another
+    assert elapsed < 1.0
+
+
+def run_in_job(fn, *args, **kwargs):
+    """Run fn inside a fresh job context; returns (result, metrics after settling)."""
+    job = ms.JobContext()
+    token = ms._current_job.set(job)
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        job.settle(ms.JOB_SETTLE_SECONDS)
+        ms._current_job.reset(token)
+    return result, job.metrics_snapshot()
+
+
+def test_enrichment_deadline_marks_the_job_degraded(fake_ai):
+    names = [f"Company {i}" for i in range(3)]
+    details, metrics = run_in_job(ms.enrich_companies, names, batch_size=3, deadline=time.time() + 0.15)
+
+    assert details["Company 0"]["founding_year"] == "1900"
+    assert not details["Company 1"]["founding_year"]
+    assert metrics["company_batch_invalid"] == 2
+    assert metrics["company_fallbacks"] == 2
+    assert ms.job_output_degraded(metrics)
+
+
+def test_invalid_single_reply_marks_the_job_degraded(fake_ai, monkeypatch):
+    monkeypatch.setattr(ms, "ai_complete", lambda *args, **kwargs: "I do not know this company.")
+    details, metrics = run_in_job(ms.fetch_company_details, "Unknown Corp")
+    assert not any(details.values())
+    assert metrics == {"company_fallbacks": 1}
+    assert ms.job_output_degraded(metrics)
+
+
+def test_settle_waits_for_background_work():
+    pool = ms.ThreadPoolExecutor(max_workers=2)
+
+    def late_failure(delay):
+        time.sleep(delay)
+        ms.record_job_metric("ai_failures")
+
+    def job_body():
+        ms.submit_in_job(pool, late_failure, 0.1)
+        ms.submit_in_job(pool, late_failure, 2.0)
+
+    original = ms.JOB_SETTLE_SECONDS
+    ms.JOB_SETTLE_SECONDS = 0.5
+    try:
+        _, metrics = run_in_job(job_body)
+    finally:
+        ms.JOB_SETTLE_SECONDS = original
+        pool.shutdown(wait=False)
+    # The failure recorded just after the job body is counted; work still running is flagged
+    assert metrics == {"ai_failures": 1, "unsettled_tasks": 1}
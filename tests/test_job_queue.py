@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import job_queue as jq
+from conftest import ROOT
+
+
+def _allocate_until_stopped(limit_mb):
+    threading.Thread(target=jq._watch_worker, args=(limit_mb, os.getppid()), daemon=True).start()
+    hog = []
+    while True:
+        hog.append(bytearray(16 * 1024 * 1024))
+        time.sleep(0.01)
+
+
+def test_memory_watchdog_stops_worker():
+    process = multiprocessing.get_context("spawn").Process(target=_allocate_until_stopped, args=(200,))
+    process.start()
+    process.join(30)
+    assert process.exitcode == jq.MEMORY_LIMIT_EXIT_CODE
+    runner = jq.ProcessJobRunner(1, memory_limit_mb=200)
+    assert "memory limit of 200 MB" in runner._death_reason(process.exitcode)
+
+
+def test_workers_are_not_daemonic_and_stop_at_shutdown():
+    runner = jq.ProcessJobRunner(2)
+    worker = runner._new_worker()
+    assert not worker.process.daemon
+    assert runner.chart_workers == max(1, (os.cpu_count() or 1) // 2)
+    runner.shutdown()
+    assert not worker.process.is_alive()
+
+
+def test_spawned_workers_skip_web_process_setup():
+    # What a job worker spawned under `python app.py` runs when it re-imports the file
+    script = (
+        "import runpy, threading, main_script\n"
+        "runpy.run_path('app.py', run_name='__mp_main__')\n"
+        "print(sorted(t.name for t in threading.enumerate()), len(main_script._progress_subscribers))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    threads, subscribers = result.stdout.strip().splitlines()[-1].rsplit(" ", 1)
+    assert "output-reaper" not in threads and "job-worker" not in threads
+    assert subscribers == "0"
+
+
+def test_queue_admission_positions_and_retry_after():
+    release = threading.Event()
+    positions = {}
+    queue = jq.JobQueue(1, max_queued=1, max_per_client=2, expected_job_seconds=10,
+                        on_position=lambda job_id, position: positions.__setitem__(job_id, position))
+
+    first, position = queue.submit("a", release.wait, owner="alice")
+    assert position == 0
+    for _ in range(50):
+        if queue.position("a") == 0:
+            break
+        time.sleep(0.01)
+    assert queue.position("a") == 0
+
+    second, position = queue.submit("b", lambda: "b", owner="bob")
+    assert position == 1 and queue.position("b") == 1
+
+    with pytest.raises(jq.QueueFull) as full:
+        queue.submit("c", lambda: None, owner="carol")
+    assert not isinstance(full.value, jq.TooManyJobs)
+    assert full.value.retry_after == 20  # two waves of one worker at 10s each
+
+    queue.max_queued = 2
+    queue.submit("d", lambda: None, owner="alice")
+    with pytest.raises(jq.TooManyJobs):
+        queue.check_admission(owner="alice")
+    assert queue.stats()["rejected"] == 2
+
+    release.set()
+    assert second.result(timeout=5) == "b"
+    assert positions["d"] == 1
+    assert queue.position("b") is None
+
+
+def test_positions_are_never_reported_after_a_job_starts():
+    events = []
+
+    def report(job_id, position):
+        time.sleep(0.01)
+        events.append(("queued", job_id))
+
+    queue = jq.JobQueue(2, max_queued=20, on_position=report)
+    futures = [
+        queue.submit(f"job{idx}", lambda idx=idx: events.append(("started", f"job{idx}")))[0]
+        for idx in range(12)
+    ]
+    for future in futures:
+        future.result(timeout=10)
+    for idx in range(12):
+        job_events = [kind for kind, job_id in events if job_id == f"job{idx}"]
+        assert job_events[-1] == "started"
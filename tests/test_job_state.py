@@ -0,0 +1,32 @@
+import time
+
+from job_state import JobStateStore
+
+
+def test_versions_increase_and_records_expire(tmp_path):
+    store = JobStateStore(str(tmp_path / "state.sqlite3"), ttl_seconds=60, max_entries=10)
+    assert store.get("job") == (None, 0)
+    assert store.put("job", {"step": 1}) == 1
+    assert store.put("job", {"step": 2}) == 2
+    assert store.get("job") == ({"step": 2}, 2)
+
+    # Another worker sees the same records through its own store
+    other = JobStateStore(store.path, ttl_seconds=60, max_entries=10)
+    assert other.get("job") == ({"step": 2}, 2)
+
+    store.ttl_seconds = 0
+    time.sleep(0.01)
+    assert store.get("job") == (None, 0)
+    store.delete("job")
+    assert other.get("job") == (None, 0)
+
+
+def test_prune_keeps_the_newest_entries(tmp_path):
+    store = JobStateStore(str(tmp_path / "state.sqlite3"), ttl_seconds=60, max_entries=3)
+    for idx in range(5):
+        store.put(f"job{idx}", {"step": idx})
+        time.sleep(0.001)
+    store.prune()
+    assert store.stats()["entries"] == 3
+    assert store.get("job0") == (None, 0)
+    assert store.get("job4") == ({"step": 4}, 1)
@@ -0,0 +1,69 @@
+import os
+import time
+
+from output_reaper import MB, OutputReaper
+
+
+def make_file(folder, name, size=1024, age=0):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def make_reaper(tmp_path, **kwargs):
+    folder = tmp_path / "outputs"
+    folder.mkdir(exist_ok=True)
+    return str(folder), OutputReaper({str(folder): 100}, backup_ttl_seconds=10,
+                                     state_path=str(tmp_path / "state.sqlite3"), **kwargs)
+
+
+def test_expires_files_and_backups_by_ttl(tmp_path):
+    folder, reaper = make_reaper(tmp_path)
+    fresh = make_file(folder, "deck.pptx", age=50)
+    old = make_file(folder, "old.pptx", age=200)
+    backup = make_file(folder, "deck_backup.pptx", age=50)
+    reaper.reap()
+    assert os.path.exists(fresh)
+    assert not os.path.exists(old)
+    assert not os.path.exists(backup)
+    assert reaper.stats()["removed"] == 2
+
+
+def test_holds_are_shared_between_workers(tmp_path):
+    folder, reaper = make_reaper(tmp_path)
+    _, other_worker = make_reaper(tmp_path)
+    running = make_file(folder, "running.pptx", age=200)
+    other_worker.hold(running)
+    reaper.reap()
+    assert os.path.exists(running)
+    assert reaper.stats()["held"] == 1
+
+    other_worker.release(running)
+    reaper.reap()
+    assert not os.path.exists(running)
+
+
+def test_stale_holds_are_dropped(tmp_path):
+    folder, reaper = make_reaper(tmp_path, hold_ttl_seconds=0.1)
+    orphan = make_file(folder, "orphan.pptx", age=200)
+    reaper.hold(orphan)
+    time.sleep(0.2)
+    reaper.reap()
+    assert not os.path.exists(orphan)
+
+
+def test_high_water_removes_oldest_unheld_files(tmp_path):
+    folder, reaper = make_reaper(tmp_path, max_bytes=3 * MB)
+    oldest = make_file(folder, "a.pptx", size=MB, age=40)
+    held = make_file(folder, "b.pptx", size=MB, age=30)
+    older = make_file(folder, "c.pptx", size=MB, age=20)
+    newest = make_file(folder, "d.pptx", size=MB, age=10)
+    reaper.hold(held)
+    reaper.reap()
+    # 4 MB is above the 3 MB limit; the oldest unheld files go until under 80%
+    assert not os.path.exists(oldest) and not os.path.exists(older)
+    assert os.path.exists(held) and os.path.exists(newest)
@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    excel = tmp_path / "data.xlsx"
+    template = tmp_path / "template.pptx"
+    excel.write_bytes(b"datasheet")
+    template.write_bytes(b"template")
+    return str(excel), str(template)
+
+
+def test_key_covers_inputs_and_options(inputs, tmp_path):
+    excel, template = inputs
+    key = ResultCache.make_key(excel, template, {"ai": True})
+    assert key == ResultCache.make_key(excel, template, {"ai": True})
+    assert key != ResultCache.make_key(excel, template, {"ai": False})
+
+    with open(excel, "ab") as f:
+        f.write(b" changed")
+    assert key != ResultCache.make_key(excel, template, {"ai": True})
+
+
+def test_round_trip_and_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    deck = tmp_path / "deck.pptx"
+    deck.write_bytes(b"x" * 1000)
+
+    for key in ("a", "b"):
+        cache.put(key, str(deck))
+    # Touch "a" so "b" is the least recently used
+    stamp = time.time() - 100
+    os.utime(cache._path("b"), (stamp, stamp))
+    assert cache.get("a", str(tmp_path / "out.pptx"))
+    cache.put("c", str(deck))
+
+    assert not cache.get("b", str(tmp_path / "out.pptx"))
+    assert cache.get("c", str(tmp_path / "out.pptx"))
+    assert (tmp_path / "out.pptx").read_bytes() == b"x" * 1000
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=0)
+    deck = tmp_path / "deck.pptx"
+    deck.write_bytes(b"x")
+    cache.put("a", str(deck))
+    assert not cache.get("a", str(tmp_path / "out.pptx"))
+    assert not (tmp_path / "cache").exists()
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10 ** 6)
+    deck = tmp_path / "deck.pptx"
+    deck.write_bytes(b"x")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(result_cache.os, "replace", fail)
+    cache.put("a", str(deck))
+    assert os.listdir(cache.directory) == []
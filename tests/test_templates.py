@@ -0,0 +1,28 @@
+"""Inline scripts in the page templates must at least parse."""
+
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+from conftest import ROOT
+
+TEMPLATES = os.path.join(ROOT, "templates")
+SCRIPT_RE = re.compile(r"<script>(.*?)</script>", re.S)
+
+node = shutil.which("node")
+
+
+@pytest.mark.skipif(node is None, reason="node is not installed")
+@pytest.mark.parametrize("name", sorted(n for n in os.listdir(TEMPLATES) if n.endswith(".html")))
+def test_inline_scripts_parse(name, tmp_path):
+    env = Environment(loader=FileSystemLoader(TEMPLATES))
+    html = env.get_template(name).render(session_id="test-session", get_flashed_messages=lambda **kw: [])
+    for idx, script in enumerate(SCRIPT_RE.findall(html)):
+        path = tmp_path / f"{name}.{idx}.js"
+        path.write_text(script)
+        result = subprocess.run([node, "--check", str(path)], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
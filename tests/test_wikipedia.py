@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+import main_script as ms
+from wiki_stub_server import start_stub_server
+
+
+@pytest.fixture
+def wiki_api(monkeypatch, tmp_path):
+    server, api_url = start_stub_server()
+    monkeypatch.setattr(ms, "WIKIPEDIA_API_URL", api_url)
+    monkeypatch.setattr(ms, "COMPANY_DETAILS_CACHE", ms.CompanyDetailsCache(str(tmp_path / "c.sqlite3"), 1))
+    yield server
+    server.shutdown()
+
+
+def test_wikipedia_batch_against_stub(wiki_api):
+    names = ["BASF", "Dow", "Stub Company 7", "Unknown Holdings"]
+    details = ms.fetch_wikipedia_details_batch(names)
+
+    assert details["BASF"]["founding_year"] == "1865"
+    assert "Ludwigshafen" in details["BASF"]["headquarters"]
+    assert details["Dow"]["founding_year"] == "1897"
+    assert details["Stub Company 7"]["founding_year"] == "1907"
+    assert not details["Unknown Holdings"].get("founding_year")
+
+
+def test_wikipedia_requests_stop_at_deadline(wiki_api):
+    details = ms.fetch_wikipedia_details_batch(["BASF"], deadline=time.time())
+    assert not details["BASF"].get("founding_year")
+
+
+def test_fallback_is_opt_in_and_cached(wiki_api, monkeypatch):
+    assert ms.COMPANY_ENRICHMENT_BACKENDS.get("none") is None
+
+    monkeypatch.setattr(ms, "COMPANY_FALLBACK_BACKEND", "wikipedia")
+    first = ms.enrich_companies(["BASF", "Arkema"], use_ai=False)
+    assert first["Arkema"]["founding_year"] == "2004"
+    assert ms.COMPANY_DETAILS_CACHE.get("BASF", source="wikipedia")["founding_year"] == "1865"
+    # Backend entries never answer the primary lookup
+    assert ms.COMPANY_DETAILS_CACHE.get("BASF") is None
+
+    wiki_api.shutdown()
+    wiki_api.server_close()
+    second = ms.enrich_companies(["BASF", "Arkema"], use_ai=False)
+    assert second["BASF"]["founding_year"] == "1865"
+
+
+def test_wikipedia_failures_are_recorded(wiki_api):
+    wiki_api.shutdown()
+    wiki_api.server_close()
+    job = ms.JobContext()
+    token = ms._current_job.set(job)
+    try:
+        ms.fetch_wikipedia_details_batch(["BASF", "Arkema"], timeout=1)
+    finally:
+        ms._current_job.reset(token)
+    assert job.metrics_snapshot()["enrichment_failures"] == 2
+    assert ms.job_output_degraded(job.metrics_snapshot())
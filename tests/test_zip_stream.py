@@ -0,0 +1,36 @@
+import io
+import zipfile
+
+import main_script as ms
+
+
+class _Unseekable(io.RawIOBase):
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def test_zip_stream_writer_output_reads_back():
+    out = _Unseekable()
+    writer = ms.ZipStreamWriter(out)
+    writer.write("[Content_Types].xml", b"<Types/>" * 100)
+    writer.write("ppt/media/image1.png", b"\x89PNG" + bytes(range(256)), compress_type=zipfile.ZIP_STORED)
+    crc, payload = ms.ZipStreamWriter.compress(b"slide" * 50, zipfile.ZIP_DEFLATED, 1)
+    writer.write_compressed("ppt/slides/slide1.xml", payload, crc, 250, zipfile.ZIP_DEFLATED)
+    writer.write("ppt/notes/é.xml", b"notes")
+    writer.close()
+
+    with zipfile.ZipFile(io.BytesIO(bytes(out.data))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [
+            "[Content_Types].xml", "ppt/media/image1.png", "ppt/slides/slide1.xml", "ppt/notes/é.xml",
+        ]
+        assert archive.read("ppt/slides/slide1.xml") == b"slide" * 50
+        assert archive.getinfo("ppt/media/image1.png").compress_type == zipfile.ZIP_STORED
+        assert archive.read("ppt/notes/é.xml") == b"notes"
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Wikipedia `action=query` API used by the company
+enrichment fallback, so it can be exercised and benchmarked offline.
+
+Serve it:
+    python wiki_stub_server.py --port 8765 --latency 0.05
+    WIKIPEDIA_API_URL=http://127.0.0.1:8765/w/api.php python app.py
+
+Benchmark the backend against it:
+    python wiki_stub_server.py --bench 200 --latency 0.05
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Canned pages (title -> intro extract) and redirects (alias -> title)
+STUB_PAGES = {
+    "BASF": "BASF SE is a German multinational chemical company. It is headquartered in Ludwigshafen, Germany. Founded in 1865, it is the largest chemical producer in the world.",
+    "Dow Chemical Company": "The Dow Chemical Company is an American multinational corporation headquartered in Midland, Michigan. It was founded in 1897 by Herbert Henry Dow.",
+    "Sumitomo Chemical": "Sumitomo Chemical Co., Ltd. is a major Japanese chemical company headquartered in Tokyo, Japan. It was established in 1913.",
+    "Evonik Industries": "Evonik Industries AG is a German specialty chemicals company headquartered in Essen, Germany. It was founded in 2007.",
+    "Arkema": "Arkema S.A. is a French specialty chemicals and advanced materials company headquartered in Colombes, near Paris. It was established in 2004.",
+}
+STUB_REDIRECTS = {
+    "Dow": "Dow Chemical Company",
+    "Dow Inc.": "Dow Chemical Company",
+    "Evonik": "Evonik Industries",
+}
+
+
+def _stub_company(i):
+    return f"Stub Company {i}"
+
+
+def _lookup_page(title):
+    if title in STUB_PAGES:
+        return title, STUB_PAGES[title]
+    if title.startswith("Stub Company "):
+        n = title.rsplit(" ", 1)[-1]
+        return title, f"{title} is a chemical company headquartered in Testville. It was founded in {1900 + int(n) % 100}."
+    return title, None
+
+
+class StubWikipediaHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        params = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        query = {}
+
+        if params.get("list") == "search":
+            term = params.get("srsearch", "")
+            matches = [t for t in STUB_PAGES if term.lower() in t.lower() or t.lower() in term.lower()]
+            query["search"] = [{"title": t} for t in matches[:int(params.get("srlimit", 10))]]
+        elif params.get("prop") == "extracts":
+            redirects, pages = [], []
+            for title in params.get("titles", "").split("|"):
+                if not title:
+                    continue
+                if title in STUB_REDIRECTS:
+                    redirects.append({"from": title, "to": STUB_REDIRECTS[title]})
+                    title = STUB_REDIRECTS[title]
+                title, extract = _lookup_page(title)
+                if extract is None:
+                    pages.append({"title": title, "missing": True})
+                else:
+                    pages.append({"title": title, "extract": extract})
+            if redirects:
+                query["redirects"] = redirects
+            query["pages"] = pages
+
+        body = json.dumps({"batchcomplete": True, "query": query}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0):
+    """Start the stub in a daemon thread. Returns (server, api_url)."""
+    handler = type("Handler", (StubWikipediaHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+
+
+def run_benchmark(count, latency):
+    server, api_url = start_stub_server(latency=latency)
+    import main_script
+    main_script.WIKIPEDIA_API_URL = api_url
+
+    names = list(STUB_PAGES) + list(STUB_REDIRECTS) + ["Unknown Holdings"]
+    names += [_stub_company(i) for i in range(max(0, count - len(names)))]
+    started = time.time()
+    results = main_script.fetch_wikipedia_details_batch(names)
+    elapsed = time.time() - started
+    filled = sum(1 for d in results.values() if d.get("founding_year"))
+    print(f"{len(names)} companies in {elapsed:.2f}s ({filled} with founding year)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--bench", type=int, metavar="N", help="benchmark N company lookups and exit")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_benchmark(args.bench, args.latency)
+    else:
+        server, api_url = start_stub_server(args.port, args.latency)
+        print(f"Stub Wikipedia API at {api_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()